@@ -0,0 +1,123 @@
+"""Compare list serialization for 10k duty assignments, old path vs new.
+
+before: documents hold ISO strings, each one is re-parsed with
+        datetime.fromisoformat, then FastAPI's default path runs
+        jsonable_encoder and json.dumps (what JSONResponse does).
+before (typed): same, but validated through a List[DutyAssignment]
+        response_model first, as the typed list endpoints did.
+after:  documents hold native datetimes (as read from Mongo with
+        tz_aware=True) and go straight through ORJSONResponse.
+
+Usage (from backend/):
+    python benchmarks/serialization_bench.py [--count 10000] [--repeat 5]
+"""
+import argparse
+import copy
+import json
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import ORJSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from server import DutyAssignment  # noqa: E402
+
+
+def make_docs(count):
+    now = datetime.now(timezone.utc)
+    user_id = str(uuid.uuid4())
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "teacher_id": str(uuid.uuid4()),
+            "classroom_id": str(uuid.uuid4()),
+            "day": i % 5,
+            "week_number": i // 500,
+            "start_date": "2025-11-24",
+            "end_date": "2025-11-28",
+            "approved": True,
+            "approved_at": now,
+            "transformed_from": None,
+            "user_id": user_id,
+            "created_at": now,
+        }
+        for i in range(count)
+    ]
+
+
+def as_strings(docs):
+    return [
+        {**d, "created_at": d["created_at"].isoformat(), "approved_at": d["approved_at"].isoformat()}
+        for d in docs
+    ]
+
+
+def dumps_like_json_response(content):
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def before(docs):
+    for d in docs:
+        if isinstance(d.get('created_at'), str):
+            d['created_at'] = datetime.fromisoformat(d['created_at'])
+        if d.get('approved_at') and isinstance(d.get('approved_at'), str):
+            d['approved_at'] = datetime.fromisoformat(d['approved_at'])
+    return dumps_like_json_response(jsonable_encoder(docs))
+
+
+ADAPTER = TypeAdapter(List[DutyAssignment])
+
+
+def before_typed(docs):
+    for d in docs:
+        if isinstance(d.get('created_at'), str):
+            d['created_at'] = datetime.fromisoformat(d['created_at'])
+        if d.get('approved_at') and isinstance(d.get('approved_at'), str):
+            d['approved_at'] = datetime.fromisoformat(d['approved_at'])
+    validated = ADAPTER.validate_python(docs)
+    return dumps_like_json_response(jsonable_encoder(validated))
+
+
+def after(docs):
+    return ORJSONResponse(docs).body
+
+
+def timeit(fn, make_input, repeat):
+    samples = []
+    for _ in range(repeat):
+        data = make_input()
+        start = time.perf_counter()
+        fn(data)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    native = make_docs(args.count)
+    strings = as_strings(native)
+
+    results = [
+        ("before", timeit(before, lambda: copy.deepcopy(strings), args.repeat)),
+        ("before (typed)", timeit(before_typed, lambda: copy.deepcopy(strings), args.repeat)),
+        ("after (orjson)", timeit(after, lambda: native, args.repeat)),
+    ]
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f"{name:16s} {seconds * 1000:9.1f} ms  ({baseline / seconds:5.1f}x vs before)")
+
+
+if __name__ == "__main__":
+    main()
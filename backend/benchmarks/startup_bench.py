@@ -0,0 +1,77 @@
+"""Measure worker cold start: module import and import-to-first-response.
+
+Usage (from backend/, with MONGO_URL and DB_NAME set):
+    python benchmarks/startup_bench.py [--runs 5] [--port 8765]
+
+Each run starts a fresh uvicorn process and polls /openapi.json until the
+first 200 arrives, so the figure includes interpreter start-up, importing
+server.py and the lifespan warm-up (Mongo ping, index creation, version
+cache prefill).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def measure_import():
+    code = (
+        "import time; t = time.perf_counter(); import server; "
+        "print(time.perf_counter() - t)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_first_response(port, timeout=30.0):
+    url = f"http://127.0.0.1:{port}/openapi.json"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise RuntimeError(f"server did not answer within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    for var in ("MONGO_URL", "DB_NAME"):
+        if var not in os.environ:
+            print(f"warning: {var} not set, relying on backend/.env")
+
+    imports = [measure_import() for _ in range(args.runs)]
+    firsts = [measure_first_response(args.port) for _ in range(args.runs)]
+
+    print(f"import server:          median {statistics.median(imports) * 1000:8.1f} ms"
+          f"  (min {min(imports) * 1000:.1f})")
+    print(f"spawn to first response: median {statistics.median(firsts) * 1000:8.1f} ms"
+          f"  (min {min(firsts) * 1000:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Convert ISO-8601 string timestamps to native BSON dates.
+
+Older writes stored ``created_at`` / ``approved_at`` as ``datetime.isoformat()``
+strings. The API now writes native dates and serializes them directly, so this
+one-off migration rewrites the remaining string values in place. It is
+idempotent and safe to re-run.
+
+Usage (from backend/, with MONGO_URL and DB_NAME set or in backend/.env):
+    python migrations/timestamps_to_dates.py [--batch-size 1000] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+TIMESTAMP_FIELDS = {
+    "users": ["created_at"],
+    "schools": ["created_at"],
+    "classrooms": ["created_at"],
+    "teachers": ["created_at"],
+    "teacher_schedules": ["created_at"],
+    "duty_assignments": ["created_at", "approved_at"],
+    "school_duties": ["created_at"],
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def migrate_collection(db, collection: str, fields, batch_size: int, dry_run: bool) -> int:
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    ops = []
+    converted = 0
+    async for doc in db[collection].find(query, projection):
+        update = {
+            field: parse_timestamp(doc[field])
+            for field in fields
+            if isinstance(doc.get(field), str)
+        }
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+        if len(ops) >= batch_size:
+            if not dry_run:
+                await db[collection].bulk_write(ops, ordered=False)
+            converted += len(ops)
+            ops = []
+    if ops:
+        if not dry_run:
+            await db[collection].bulk_write(ops, ordered=False)
+        converted += len(ops)
+    return converted
+
+
+async def main(batch_size: int, dry_run: bool):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        for collection, fields in TIMESTAMP_FIELDS.items():
+            converted = await migrate_collection(db, collection, fields, batch_size, dry_run)
+            action = "would convert" if dry_run else "converted"
+            print(f"{collection}: {action} {converted} documents")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.dry_run))
@@ -1,31 +1,70 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, status
+from contextlib import asynccontextmanager
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
 import logging
+import asyncio
+import time
+import json
+import multiprocessing
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict
+from typing import Annotated, List, Optional, Dict
 import uuid
-from datetime import datetime, timezone, timedelta
+import hashlib
+import secrets
+import csv
+from datetime import date, datetime, timezone, timedelta
 import jwt
 from passlib.context import CryptContext
-from io import BytesIO
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from fastapi.responses import StreamingResponse
+from io import BytesIO, StringIO
+from fastapi.responses import StreamingResponse, ORJSONResponse
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection (opened in the lifespan handler so importing the module stays cheap)
+client: Optional[AsyncIOMotorClient] = None
+db = None
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+
+# Background jobs: coroutine workers per process, CPU-bound work in a process pool
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '2'))
+JOB_PROCESS_WORKERS = int(os.environ.get('JOB_PROCESS_WORKERS', str(min(4, os.cpu_count() or 1))))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2'))
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', '10'))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '120'))
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', str(24 * 60 * 60)))
+process_pool: Optional[ProcessPoolExecutor] = None
+job_wakeup: Optional[asyncio.Event] = None
+job_worker_tasks: List[asyncio.Task] = []
+
+# Per-tenant, per-week leases
+WEEK_LEASE_SECONDS = int(os.environ.get('WEEK_LEASE_SECONDS', '60'))
+WEEK_LEASE_WAIT_SECONDS = float(os.environ.get('WEEK_LEASE_WAIT_SECONDS', '10'))
+
+# Cold storage for old approved weeks
+COLD_STORAGE_HORIZON_DAYS = int(os.environ.get('COLD_STORAGE_HORIZON_DAYS', '90'))
+COLD_STORAGE_COMPRESSION = os.environ.get('COLD_STORAGE_COMPRESSION', 'zlib')  # "zlib" or "" for none
+
+# Collection versions (ETags) are cached per process. Without a change
+# stream (standalone mongod) entries expire after this many seconds, which
+# bounds how long another worker's write can go unseen
+VERSION_CACHE_SECONDS = float(os.environ.get('VERSION_CACHE_SECONDS', '5'))
+
+# Calendar feeds are rebuilt this many seconds after the last relevant write
+FEED_REBUILD_DELAY = float(os.environ.get('FEED_REBUILD_DELAY', '2'))
+# Archived weeks whose expanded rows are kept in memory for feed rebuilds
+FEED_ARCHIVE_CACHE_WEEKS = int(os.environ.get('FEED_ARCHIVE_CACHE_WEEKS', '500'))
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -34,8 +73,71 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production'
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 
+# Indexes backing the per-tenant queries issued by the endpoints below
+INDEXES = {
+    "users": [[("id", 1)], [("email", 1)]],
+    "schools": [[("user_id", 1), ("id", 1)]],
+    "classrooms": [[("user_id", 1), ("id", 1)]],
+    "teachers": [[("user_id", 1), ("id", 1)]],
+    "teacher_schedules": [[("user_id", 1), ("teacher_id", 1)]],
+    "duty_assignments": [
+        [("user_id", 1), ("week_number", 1), ("approved", 1)],
+        [("user_id", 1), ("approved", 1)],
+        [("user_id", 1), ("id", 1)],
+    ],
+    "school_duties": [[("user_id", 1), ("year", 1), ("month", 1)]],
+    "collection_versions": [([("user_id", 1), ("collection", 1)], {"unique": True})],
+    "jobs": [
+        [("user_id", 1), ("id", 1)],
+        [("status", 1), ("created_at", 1)],
+        ([("active_key", 1)], {"unique": True, "sparse": True}),
+        ([("finished_at", 1)], {"expireAfterSeconds": JOB_RETENTION_SECONDS}),
+    ],
+    "week_leases": [([("expires_at", 1)], {"expireAfterSeconds": 0})],
+    "archived_weeks": [
+        ([("user_id", 1), ("week_number", 1)], {"unique": True}),
+        [("user_id", 1), ("assignment_ids", 1)],
+    ],
+    "teacher_feeds": [
+        ([("token", 1)], {"unique": True}),
+        ([("user_id", 1), ("teacher_id", 1)], {"unique": True}),
+    ],
+}
+
+async def ensure_indexes():
+    for collection, indexes in INDEXES.items():
+        for spec in indexes:
+            keys, options = spec if isinstance(spec, tuple) else (spec, {})
+            await db[collection].create_index(keys, **options)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db
+    client = AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        tz_aware=True,
+    )
+    db = client[os.environ['DB_NAME']]
+    # Warm up: open the first pooled connection, build indexes, prefill the
+    # ETag version cache and load the bcrypt backend so the first real
+    # request does not pay for it
+    await client.admin.command("ping")
+    await ensure_indexes()
+    pwd_context.handler("bcrypt").get_backend()
+    await start_version_cache()
+    start_job_workers()
+    try:
+        yield
+    finally:
+        await stop_job_workers()
+        await stop_version_cache()
+        await stop_feed_rebuilds()
+        client.close()
+
 # Create the main app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # ===== MODELS =====
@@ -154,6 +256,33 @@ class SchoolDutyCreate(BaseModel):
     duty_type: str
     dates: List[str]
 
+class SimulationVariant(BaseModel):
+    name: Optional[str] = None
+    weekly_duty_limits: Dict[str, int] = Field(default_factory=dict)  # teacher_id -> overridden limit
+    duty_limit_delta: int = 0  # Added to every teacher's limit
+    extra_classrooms: List[ClassroomCreate] = Field(default_factory=list)  # Hypothetical new locations
+    excluded_days: Dict[str, List[Annotated[int, Field(ge=0, le=4)]]] = Field(default_factory=dict)  # teacher_id -> days (0-4) without duty
+    exclude_heavy_days: bool = False  # Keep everyone off their heavy teaching days
+
+class SimulationRequest(BaseModel):
+    week_number: int
+    variants: List[SimulationVariant] = Field(min_length=1, max_length=20)
+
+class Job(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    kind: str  # "generate", "transform", "export-pdf", "compact-archive"
+    params: Dict
+    status: str = "queued"  # queued, running, succeeded, failed, cancelled
+    progress: int = 0  # 0-100
+    message: Optional[str] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    user_id: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 # ===== AUTH HELPERS =====
 
 def verify_password(plain_password, hashed_password):
@@ -186,6 +315,122 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="User not found")
     return User(**user)
 
+# ===== CONDITIONAL GET HELPERS =====
+# Versions are cached in-process so a matching If-None-Match is answered
+# with a 304 without a Mongo round-trip. Writes through this process update
+# the cache directly. Writes through other processes arrive via a change
+# stream on collection_versions where the server supports one (replica
+# sets); otherwise cached entries expire after VERSION_CACHE_SECONDS.
+
+version_cache: Dict[tuple, tuple] = {}  # (user_id, collection) -> (version, cached_at)
+version_cache_live = False  # True while the change stream keeps the cache current
+version_watch_task: Optional[asyncio.Task] = None
+
+def cache_collection_version(user_id: str, collection: str, version: int):
+    # Versions only grow, so an older value arriving late never wins
+    key = (user_id, collection)
+    cached = version_cache.get(key)
+    version_cache[key] = (max(version, cached[0]) if cached else version, time.monotonic())
+
+async def get_collection_version(user_id: str, collection: str) -> int:
+    cached = version_cache.get((user_id, collection))
+    if cached and (version_cache_live or time.monotonic() - cached[1] < VERSION_CACHE_SECONDS):
+        return cached[0]
+    doc = await db.collection_versions.find_one(
+        {"user_id": user_id, "collection": collection},
+        {"_id": 0, "version": 1}
+    )
+    version = doc["version"] if doc else 0
+    cache_collection_version(user_id, collection, version)
+    return version
+
+async def bump_collection_version(user_id: str, collection: str):
+    doc = await db.collection_versions.find_one_and_update(
+        {"user_id": user_id, "collection": collection},
+        {"$inc": {"version": 1}},
+        projection={"_id": 0, "version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    cache_collection_version(user_id, collection, doc["version"])
+    # Calendar feeds are derived from these collections
+    if collection in FEED_SOURCE_COLLECTIONS:
+        schedule_feed_rebuild(user_id)
+
+async def prefill_version_cache():
+    async for doc in db.collection_versions.find({}, {"_id": 0, "user_id": 1, "collection": 1, "version": 1}):
+        cache_collection_version(doc["user_id"], doc["collection"], doc["version"])
+
+async def follow_version_changes(stream):
+    global version_cache_live
+    try:
+        async for change in stream:
+            doc = change.get("fullDocument")
+            if doc:
+                cache_collection_version(doc["user_id"], doc["collection"], doc["version"])
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.warning("Collection version change stream stopped, falling back to %ss cache expiry", VERSION_CACHE_SECONDS, exc_info=True)
+    finally:
+        version_cache_live = False
+        await stream.close()
+
+async def start_version_cache():
+    """Prefill the version cache and keep it current where change streams are available."""
+    global version_cache_live, version_watch_task
+    stream = db.collection_versions.watch(full_document="updateLookup")
+    try:
+        # Opens the stream; a standalone server rejects it
+        change = await stream.try_next()
+    except OperationFailure:
+        logger.info("No change streams on this server, collection versions expire after %ss", VERSION_CACHE_SECONDS)
+        await stream.close()
+        stream = change = None
+    # Prefilled after the stream opened, so no bump can fall in between
+    await prefill_version_cache()
+    if stream is not None:
+        if change and change.get("fullDocument"):
+            doc = change["fullDocument"]
+            cache_collection_version(doc["user_id"], doc["collection"], doc["version"])
+        version_cache_live = True
+        version_watch_task = asyncio.create_task(follow_version_changes(stream))
+
+async def stop_version_cache():
+    global version_watch_task
+    if version_watch_task is not None:
+        version_watch_task.cancel()
+        await asyncio.gather(version_watch_task, return_exceptions=True)
+        version_watch_task = None
+
+def make_etag(user_id: str, collection: str, version: int, *parts) -> str:
+    # The tenant is part of the tag so a shared browser cache never serves one
+    # user's 304 against another user's cached body
+    key = ":".join(str(p) for p in (user_id, collection, version, *parts))
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+async def collection_etag_headers(user_id: str, collection: str, *parts) -> dict:
+    version = await get_collection_version(user_id, collection)
+    return {
+        "ETag": make_etag(user_id, collection, version, *parts),
+        "Vary": "Authorization",
+        "Cache-Control": "private, no-cache",
+    }
+
+def json_response(content, headers: Optional[dict] = None) -> ORJSONResponse:
+    # Documents come straight from Mongo with native datetimes, so orjson can
+    # encode them as-is without a Pydantic/jsonable_encoder round-trip
+    return ORJSONResponse(content, headers=headers)
+
 # ===== AUTH ENDPOINTS =====
 
 @api_router.post("/auth/register", response_model=Token)
@@ -225,17 +470,17 @@ async def get_me(current_user: User = Depends(get_current_user)):
 async def create_school(school_data: SchoolCreate, current_user: User = Depends(get_current_user)):
     school = School(**school_data.model_dump(), user_id=current_user.id)
     doc = school.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.schools.insert_one(doc)
+    await bump_collection_version(current_user.id, "schools")
     return school
 
 @api_router.get("/schools", response_model=List[School])
-async def get_schools(current_user: User = Depends(get_current_user)):
+async def get_schools(request: Request, current_user: User = Depends(get_current_user)):
+    headers = await collection_etag_headers(current_user.id, "schools")
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
     schools = await db.schools.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    for school in schools:
-        if isinstance(school.get('created_at'), str):
-            school['created_at'] = datetime.fromisoformat(school['created_at'])
-    return schools
+    return json_response(schools, headers=headers)
 
 @api_router.put("/schools/{school_id}")
 async def update_school(school_id: str, school_data: SchoolCreate, current_user: User = Depends(get_current_user)):
@@ -245,6 +490,7 @@ async def update_school(school_id: str, school_data: SchoolCreate, current_user:
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="School not found")
+    await bump_collection_version(current_user.id, "schools")
     return {"message": "School updated"}
 
 @api_router.delete("/schools/{school_id}")
@@ -252,6 +498,7 @@ async def delete_school(school_id: str, current_user: User = Depends(get_current
     result = await db.schools.delete_one({"id": school_id, "user_id": current_user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="School not found")
+    await bump_collection_version(current_user.id, "schools")
     return {"message": "School deleted"}
 
 # ===== CLASSROOM ENDPOINTS =====
@@ -260,17 +507,17 @@ async def delete_school(school_id: str, current_user: User = Depends(get_current
 async def create_classroom(classroom_data: ClassroomCreate, current_user: User = Depends(get_current_user)):
     classroom = Classroom(**classroom_data.model_dump(), user_id=current_user.id)
     doc = classroom.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.classrooms.insert_one(doc)
+    await bump_collection_version(current_user.id, "classrooms")
     return classroom
 
 @api_router.get("/classrooms", response_model=List[Classroom])
-async def get_classrooms(current_user: User = Depends(get_current_user)):
+async def get_classrooms(request: Request, current_user: User = Depends(get_current_user)):
+    headers = await collection_etag_headers(current_user.id, "classrooms")
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
     classrooms = await db.classrooms.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    for classroom in classrooms:
-        if isinstance(classroom.get('created_at'), str):
-            classroom['created_at'] = datetime.fromisoformat(classroom['created_at'])
-    return classrooms
+    return json_response(classrooms, headers=headers)
 
 @api_router.put("/classrooms/{classroom_id}")
 async def update_classroom(classroom_id: str, classroom_data: ClassroomCreate, current_user: User = Depends(get_current_user)):
@@ -280,6 +527,7 @@ async def update_classroom(classroom_id: str, classroom_data: ClassroomCreate, c
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Classroom not found")
+    await bump_collection_version(current_user.id, "classrooms")
     return {"message": "Classroom updated"}
 
 @api_router.delete("/classrooms/{classroom_id}")
@@ -287,6 +535,7 @@ async def delete_classroom(classroom_id: str, current_user: User = Depends(get_c
     result = await db.classrooms.delete_one({"id": classroom_id, "user_id": current_user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Classroom not found")
+    await bump_collection_version(current_user.id, "classrooms")
     return {"message": "Classroom deleted"}
 
 # ===== TEACHER ENDPOINTS =====
@@ -295,17 +544,17 @@ async def delete_classroom(classroom_id: str, current_user: User = Depends(get_c
 async def create_teacher(teacher_data: TeacherCreate, current_user: User = Depends(get_current_user)):
     teacher = Teacher(**teacher_data.model_dump(), user_id=current_user.id)
     doc = teacher.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.teachers.insert_one(doc)
+    await bump_collection_version(current_user.id, "teachers")
     return teacher
 
 @api_router.get("/teachers", response_model=List[Teacher])
-async def get_teachers(current_user: User = Depends(get_current_user)):
+async def get_teachers(request: Request, current_user: User = Depends(get_current_user)):
+    headers = await collection_etag_headers(current_user.id, "teachers")
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
     teachers = await db.teachers.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    for teacher in teachers:
-        if isinstance(teacher.get('created_at'), str):
-            teacher['created_at'] = datetime.fromisoformat(teacher['created_at'])
-    return teachers
+    return json_response(teachers, headers=headers)
 
 @api_router.put("/teachers/{teacher_id}")
 async def update_teacher(teacher_id: str, teacher_data: TeacherCreate, current_user: User = Depends(get_current_user)):
@@ -315,6 +564,7 @@ async def update_teacher(teacher_id: str, teacher_data: TeacherCreate, current_u
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Teacher not found")
+    await bump_collection_version(current_user.id, "teachers")
     return {"message": "Teacher updated"}
 
 @api_router.delete("/teachers/{teacher_id}")
@@ -322,6 +572,7 @@ async def delete_teacher(teacher_id: str, current_user: User = Depends(get_curre
     result = await db.teachers.delete_one({"id": teacher_id, "user_id": current_user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Teacher not found")
+    await bump_collection_version(current_user.id, "teachers")
     return {"message": "Teacher deleted"}
 
 # ===== TEACHER SCHEDULE ENDPOINTS =====
@@ -337,22 +588,23 @@ async def create_teacher_schedule(schedule_data: TeacherScheduleCreate, current_
             {"$set": {"weekly_hours": schedule_data.weekly_hours}}
         )
         existing['weekly_hours'] = schedule_data.weekly_hours
+        await bump_collection_version(current_user.id, "teacher_schedules")
         return TeacherSchedule(**existing)
     
     # Create new
     schedule = TeacherSchedule(**schedule_data.model_dump(), user_id=current_user.id)
     doc = schedule.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.teacher_schedules.insert_one(doc)
+    await bump_collection_version(current_user.id, "teacher_schedules")
     return schedule
 
 @api_router.get("/teacher-schedules", response_model=List[TeacherSchedule])
-async def get_teacher_schedules(current_user: User = Depends(get_current_user)):
+async def get_teacher_schedules(request: Request, current_user: User = Depends(get_current_user)):
+    headers = await collection_etag_headers(current_user.id, "teacher_schedules")
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
     schedules = await db.teacher_schedules.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    for schedule in schedules:
-        if isinstance(schedule.get('created_at'), str):
-            schedule['created_at'] = datetime.fromisoformat(schedule['created_at'])
-    return schedules
+    return json_response(schedules, headers=headers)
 
 @api_router.get("/teacher-schedules/{teacher_id}")
 async def get_teacher_schedule(teacher_id: str, current_user: User = Depends(get_current_user)):
@@ -363,22 +615,17 @@ async def get_teacher_schedule(teacher_id: str, current_user: User = Depends(get
     if not schedule:
         # Return default empty schedule
         return {"teacher_id": teacher_id, "weekly_hours": [0, 0, 0, 0, 0]}
-    if isinstance(schedule.get('created_at'), str):
-        schedule['created_at'] = datetime.fromisoformat(schedule['created_at'])
-    return schedule
+    return json_response(schedule)
 
-# ===== DUTY ASSIGNMENT ENDPOINTS =====
+# ===== DUTY PLANNING =====
+# Pure functions over plain documents so they can run in the process pool.
 
-@api_router.post("/duty-assignments/generate")
-async def generate_duty_assignments(week_number: int, current_user: User = Depends(get_current_user)):
-    # Get all teachers, teacher schedules, and classrooms
-    teachers = await db.teachers.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    teacher_schedules = await db.teacher_schedules.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    classrooms = await db.classrooms.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    
-    # Clear existing unapproved assignments for this week
-    await db.duty_assignments.delete_many({"user_id": current_user.id, "week_number": week_number, "approved": False})
-    
+HEAVY_DAY_HOURS = 7
+DAY_NAMES = ['Pazartesi', 'Salı', 'Çarşamba', 'Perşembe', 'Cuma']
+
+def plan_duty_assignments(teachers: list, teacher_schedules: list, classrooms: list, week_number: int, user_id: str, unavailable: Optional[set] = None):
+    # unavailable: optional set of (teacher_id, day) pairs that must not get a duty
+    unavailable = unavailable or set()
     assignments = []
     teacher_duty_count = {t['id']: 0 for t in teachers}
     
@@ -420,6 +667,7 @@ async def generate_duty_assignments(week_number: int, current_user: User = Depen
                 suitable_teachers = [
                     t for t in school_teachers 
                     if teacher_duty_count[t['id']] < t['weekly_duty_limit']
+                    and (t['id'], day) not in unavailable
                 ]
                 
                 if not suitable_teachers:
@@ -441,15 +689,9 @@ async def generate_duty_assignments(week_number: int, current_user: User = Depen
                     day=day,
                     week_number=week_number,
                     approved=False,
-                    user_id=current_user.id
+                    user_id=user_id
                 )
                 
-                doc = assignment.model_dump()
-                doc['created_at'] = doc['created_at'].isoformat()
-                if doc.get('approved_at'):
-                    doc['approved_at'] = doc['approved_at'].isoformat()
-                await db.duty_assignments.insert_one(doc)
-                
                 teacher_duty_count[selected_teacher['id']] += 1
                 assigned_locations.add(location_key)
                 assignments.append(assignment)
@@ -463,7 +705,7 @@ async def generate_duty_assignments(week_number: int, current_user: User = Depen
         # Check if teacher has heavy workload on duty days
         for assignment in duty_days:
             hours_that_day = teacher_workload.get(teacher_id, [0,0,0,0,0])[assignment.day]
-            if hours_that_day >= 7:  # Heavy day (7+ hours)
+            if hours_that_day >= HEAVY_DAY_HOURS:  # Heavy day (7+ hours)
                 suggestions.append({
                     "teacher_id": teacher_id,
                     "teacher_name": teacher['name'],
@@ -472,100 +714,18 @@ async def generate_duty_assignments(week_number: int, current_user: User = Depen
                     "suggestion": f"{teacher['name']} bu gün {hours_that_day} saat ders yapıyor. Nöbet vermemek daha uygun olabilir."
                 })
     
-    return {
-        "message": f"Generated {len(assignments)} duty assignments for week {week_number}",
-        "suggestions": suggestions
-    }
+    return [a.model_dump() for a in assignments], suggestions
 
-@api_router.get("/duty-assignments")
-async def get_duty_assignments(week_number: int, approved: Optional[bool] = None, current_user: User = Depends(get_current_user)):
-    query = {"user_id": current_user.id, "week_number": week_number}
-    if approved is not None:
-        query["approved"] = approved
-        
-    assignments = await db.duty_assignments.find(query, {"_id": 0}).to_list(10000)
-    
-    for assignment in assignments:
-        if isinstance(assignment.get('created_at'), str):
-            assignment['created_at'] = datetime.fromisoformat(assignment['created_at'])
-        if assignment.get('approved_at') and isinstance(assignment.get('approved_at'), str):
-            assignment['approved_at'] = datetime.fromisoformat(assignment['approved_at'])
-    
-    return assignments
-
-@api_router.post("/duty-assignments", response_model=DutyAssignment)
-async def create_duty_assignment(assignment_data: DutyAssignmentCreate, current_user: User = Depends(get_current_user)):
-    assignment = DutyAssignment(**assignment_data.model_dump(), user_id=current_user.id)
-    doc = assignment.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    if doc.get('approved_at'):
-        doc['approved_at'] = doc['approved_at'].isoformat()
-    await db.duty_assignments.insert_one(doc)
-    return assignment
-
-@api_router.put("/duty-assignments/{assignment_id}")
-async def update_duty_assignment(
-    assignment_id: str, 
-    assignment_data: DutyAssignmentCreate, 
-    current_user: User = Depends(get_current_user)
-):
-    result = await db.duty_assignments.update_one(
-        {"id": assignment_id, "user_id": current_user.id},
-        {"$set": assignment_data.model_dump()}
-    )
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Assignment not found")
-    return {"message": "Assignment updated"}
-
-@api_router.delete("/duty-assignments/{assignment_id}")
-async def delete_duty_assignment(assignment_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.duty_assignments.delete_one({"id": assignment_id, "user_id": current_user.id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Assignment not found")
-    return {"message": "Assignment deleted"}
-
-@api_router.post("/duty-assignments/approve")
-async def approve_duty_assignments(week_number: int, current_user: User = Depends(get_current_user)):
-    result = await db.duty_assignments.update_many(
-        {"user_id": current_user.id, "week_number": week_number, "approved": False},
-        {"$set": {"approved": True, "approved_at": datetime.now(timezone.utc).isoformat()}}
-    )
-    return {"message": f"Approved {result.modified_count} duty assignments"}
-
-@api_router.post("/duty-assignments/transform")
-async def transform_duty_assignments(week_number: int, current_user: User = Depends(get_current_user)):
-    # Get current approved assignments
-    current_assignments = await db.duty_assignments.find(
-        {"user_id": current_user.id, "week_number": week_number, "approved": True},
-        {"_id": 0}
-    ).to_list(10000)
-    
-    if not current_assignments:
-        raise HTTPException(status_code=404, detail="No approved assignments found for this week")
-    
-    # Get teachers and teacher schedules
-    teachers = await db.teachers.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    teacher_schedules = await db.teacher_schedules.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    
+def plan_transformed_assignments(current_assignments: list, teachers: list, teacher_schedules: list, classrooms: list, new_week_number: int, user_id: str):
     # Create teacher workload lookup
     teacher_workload = {}
     for ts in teacher_schedules:
         teacher_workload[ts['teacher_id']] = ts['weekly_hours']
     
-    # Create new week number (next available week)
-    all_weeks = await db.duty_assignments.find(
-        {"user_id": current_user.id},
-        {"week_number": 1, "_id": 0}
-    ).to_list(10000)
-    max_week = max([a['week_number'] for a in all_weeks] + [week_number])
-    new_week_number = max_week + 1
-    
     # Create new assignments with transformation
     new_assignments = []
     teacher_duty_count = {t['id']: 0 for t in teachers}
     
-    # Get school info for filtering
-    classrooms = await db.classrooms.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
     classroom_school_map = {c['id']: c['school_id'] for c in classrooms}
     
     for old_assignment in current_assignments:
@@ -604,53 +764,20 @@ async def transform_duty_assignments(week_number: int, current_user: User = Depe
             approved=True,  # Auto-approve transformed duties
             approved_at=datetime.now(timezone.utc),
             transformed_from=old_assignment['id'],
-            user_id=current_user.id
+            user_id=user_id
         )
         
-        doc = assignment.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        if doc.get('approved_at'):
-            doc['approved_at'] = doc['approved_at'].isoformat()
-        await db.duty_assignments.insert_one(doc)
-        
         teacher_duty_count[selected_teacher['id']] += 1
-        new_assignments.append(assignment)
-    
-    return {
-        "message": f"Transformed {len(new_assignments)} assignments to week {new_week_number}",
-        "new_week_number": new_week_number,
-        "count": len(new_assignments)
-    }
-
-@api_router.put("/duty-assignments/archive/{week_number}")
-async def update_archived_assignment(
-    week_number: int,
-    assignment_id: str,
-    assignment_data: DutyAssignmentCreate,
-    current_user: User = Depends(get_current_user)
-):
-    result = await db.duty_assignments.update_one(
-        {"id": assignment_id, "week_number": week_number, "user_id": current_user.id, "approved": True},
-        {"$set": assignment_data.model_dump()}
-    )
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Assignment not found or not approved")
-    return {"message": "Assignment updated"}
-
-@api_router.get("/duty-assignments/export-pdf")
-async def export_duty_assignments_pdf(week_number: int, current_user: User = Depends(get_current_user)):
-    # Get approved assignments
-    assignments = await db.duty_assignments.find(
-        {"user_id": current_user.id, "week_number": week_number, "approved": True},
-        {"_id": 0}
-    ).to_list(10000)
+        new_assignments.append(assignment.model_dump())
     
-    if not assignments:
-        raise HTTPException(status_code=404, detail="No approved assignments found")
-    
-    # Get related data
-    teachers = await db.teachers.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
-    classrooms = await db.classrooms.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
+    return new_assignments
+
+def render_assignments_pdf(assignments: list, teachers: list, classrooms: list, week_number: int) -> bytes:
+    # ReportLab is only needed here, so load it on first export instead of at startup
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet
     
     teacher_map = {t['id']: t['name'] for t in teachers}
     classroom_map = {c['id']: c['name'] for c in classrooms}
@@ -664,8 +791,6 @@ async def export_duty_assignments_pdf(week_number: int, current_user: User = Dep
     elements.append(Paragraph(f"Hafta {week_number} Nöbet Çizelgesi", styles['Title']))
     elements.append(Spacer(1, 12))
     
-    # Create table
-    days = ['Pazartesi', 'Salı', 'Çarşamba', 'Perşembe', 'Cuma']
     
     # Group assignments by classroom
     classroom_assignments = {}
@@ -676,7 +801,7 @@ async def export_duty_assignments_pdf(week_number: int, current_user: User = Dep
         classroom_assignments[classroom_id][assignment['day']] = assignment['teacher_id']
     
     # Build table data
-    table_data = [['Nöbet Yeri'] + days]
+    table_data = [['Nöbet Yeri'] + DAY_NAMES]
     
     for classroom_id, day_assignments in classroom_assignments.items():
         row = [classroom_map.get(classroom_id, 'Bilinmeyen')]
@@ -701,23 +826,642 @@ async def export_duty_assignments_pdf(week_number: int, current_user: User = Dep
     elements.append(table)
     doc.build(elements)
     
-    buffer.seek(0)
+    return buffer.getvalue()
+
+def simulate_variant(teachers: list, teacher_schedules: list, classrooms: list, variant: dict, week_number: int, user_id: str) -> dict:
+    """Run the generator on a modified copy of the snapshot and score the outcome."""
+    limits = variant.get('weekly_duty_limits') or {}
+    delta = variant.get('duty_limit_delta') or 0
+    teachers = [
+        {**t, 'weekly_duty_limit': max(0, limits.get(t['id'], t['weekly_duty_limit']) + delta)}
+        for t in teachers
+    ]
+    classrooms = classrooms + [
+        {**c, 'id': f"simulated-{i}"} for i, c in enumerate(variant.get('extra_classrooms') or [])
+    ]
+    
+    unavailable = {
+        (teacher_id, day)
+        for teacher_id, days in (variant.get('excluded_days') or {}).items()
+        for day in days
+    }
+    if variant.get('exclude_heavy_days'):
+        for ts in teacher_schedules:
+            for day, hours in enumerate(ts['weekly_hours']):
+                if hours >= HEAVY_DAY_HOURS:
+                    unavailable.add((ts['teacher_id'], day))
+    
+    assignments, suggestions = plan_duty_assignments(
+        teachers, teacher_schedules, classrooms, week_number, user_id, unavailable
+    )
+    
+    # Coverage: share of classroom/day slots that received a teacher
+    slots = len(classrooms) * 5
+    # Fairness: spread of duty counts and Jain's index (1.0 = perfectly even)
+    counts = {t['id']: 0 for t in teachers}
+    for a in assignments:
+        counts[a['teacher_id']] += 1
+    values = list(counts.values())
+    mean = sum(values) / len(values) if values else 0
+    squares = sum(v * v for v in values)
+    
+    return {
+        "name": variant.get('name'),
+        "assigned": len(assignments),
+        "slots": slots,
+        "coverage": round(len(assignments) / slots, 4) if slots else 0,
+        "fairness": {
+            "min_duties": min(values, default=0),
+            "max_duties": max(values, default=0),
+            "stdev": round((sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5, 4) if values else 0,
+            "jain_index": round(sum(values) ** 2 / (len(values) * squares), 4) if squares else 1.0,
+        },
+        "heavy_day_suggestions": len(suggestions),
+    }
+
+async def run_in_process_pool(fn, *args):
+    # Falls back to running inline when no pool exists (e.g. scripts importing the module)
+    if process_pool is None:
+        return fn(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_pool, fn, *args)
+
+# ===== WEEK LEASES =====
+# Operations that rewrite a week (generate, approve, transform, compaction,
+# thaw and edits to approved rows) hold a lease on (user_id, week_number) in `week_leases`, so they
+# serialize per tenant and week across workers while other weeks and tenants
+# proceed. Leases expire, and are renewed while held, so a crashed holder
+# cannot block a week for longer than WEEK_LEASE_SECONDS.
+
+async def try_acquire_week_lease(key: str, user_id: str, week_number: int, holder: str) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        # Matches only a free (expired) lease; otherwise the upsert collides on _id
+        await db.week_leases.update_one(
+            {"_id": key, "expires_at": {"$lt": now}},
+            {"$set": {
+                "user_id": user_id,
+                "week_number": week_number,
+                "holder": holder,
+                "expires_at": now + timedelta(seconds=WEEK_LEASE_SECONDS)
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+@asynccontextmanager
+async def week_lease(user_id: str, week_number: int):
+    key = f"{user_id}:{week_number}"
+    holder = str(uuid.uuid4())
+    deadline = asyncio.get_running_loop().time() + WEEK_LEASE_WAIT_SECONDS
+    while not await try_acquire_week_lease(key, user_id, week_number, holder):
+        if asyncio.get_running_loop().time() >= deadline:
+            raise HTTPException(status_code=409, detail=f"Week {week_number} is being modified by another operation, please retry")
+        await asyncio.sleep(0.1)
+    
+    loop = asyncio.get_running_loop()
+    owner = asyncio.current_task()
+    state = {"holding": True, "lost": False}
+    
+    async def renew():
+        valid_until = loop.time() + WEEK_LEASE_SECONDS
+        while True:
+            await asyncio.sleep(WEEK_LEASE_SECONDS / 3)
+            sent_at = loop.time()
+            try:
+                result = await db.week_leases.update_one(
+                    {"_id": key, "holder": holder},
+                    {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=WEEK_LEASE_SECONDS)}}
+                )
+            except Exception:
+                logger.warning("Could not renew lease on %s", key, exc_info=True)
+                # Keep retrying while the last confirmed renewal still covers us
+                if loop.time() + WEEK_LEASE_SECONDS / 3 < valid_until:
+                    continue
+            else:
+                if result.matched_count:
+                    valid_until = sent_at + WEEK_LEASE_SECONDS
+                    continue
+            # The lease expired or was taken over: stop the holder before it
+            # writes alongside the new owner
+            logger.error("Lost lease on %s, aborting the operation holding it", key)
+            if state["holding"]:
+                state["lost"] = True
+                owner.cancel()
+            return
+    
+    renew_task = asyncio.create_task(renew())
+    try:
+        yield
+    except asyncio.CancelledError:
+        if not state["lost"]:
+            raise
+        owner.uncancel()
+        raise HTTPException(status_code=409, detail=f"Lost the lock on week {week_number}, the operation was aborted, please retry")
+    finally:
+        state["holding"] = False
+        renew_task.cancel()
+        await db.week_leases.delete_one({"_id": key, "holder": holder})
+
+async def allocate_week_number(user_id: str, minimum: int) -> int:
+    """Atomically reserve the next week number above every existing week."""
+    # $max keeps the counter in step with weeks created directly (generate on
+    # an arbitrary week); $inc then hands out each number exactly once
+    floor = max(await get_max_week_number(user_id) or minimum, minimum)
+    await db.week_counters.update_one({"_id": user_id}, {"$max": {"last_week": floor}}, upsert=True)
+    counter = await db.week_counters.find_one_and_update(
+        {"_id": user_id},
+        {"$inc": {"last_week": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["last_week"]
+
+# ===== DUTY OPERATIONS =====
+# Shared by the synchronous endpoints and the background job handlers.
+# `progress` is awaited between phases; job handlers use it to publish
+# progress and to abort (by raising JobCancelled) before anything is written.
+
+async def no_progress(percent: int, message: Optional[str] = None):
+    pass
+
+async def week_has_approved_rows(user_id: str, week_number: int) -> bool:
+    query = {"user_id": user_id, "week_number": week_number}
+    return (
+        await db.duty_assignments.find_one({**query, "approved": True}, {"_id": 1}) is not None
+        or await db.archived_weeks.find_one(query, {"_id": 1}) is not None
+    )
+
+async def run_generate(user_id: str, week_number: int, progress=no_progress) -> dict:
+    # Get all teachers, teacher schedules, and classrooms
+    teachers = await db.teachers.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    teacher_schedules = await db.teacher_schedules.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    classrooms = await db.classrooms.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    await progress(10, "Veriler yüklendi")
+    
+    docs, suggestions = await run_in_process_pool(
+        plan_duty_assignments, teachers, teacher_schedules, classrooms, week_number, user_id
+    )
+    await progress(60, "Nöbetler oluşturuldu")
+    
+    async with week_lease(user_id, week_number):
+        # Regenerating on top of an approved week would leave it half
+        # approved, half draft; approval may have won the race for the lease
+        if await week_has_approved_rows(user_id, week_number):
+            raise HTTPException(status_code=409, detail=f"Week {week_number} is already approved")
+        # Clear existing unapproved assignments for this week
+        await db.duty_assignments.delete_many({"user_id": user_id, "week_number": week_number, "approved": False})
+        if docs:
+            await db.duty_assignments.insert_many(docs)
+    await bump_collection_version(user_id, "duty_assignments")
+    
+    return {
+        "message": f"Generated {len(docs)} duty assignments for week {week_number}",
+        "suggestions": suggestions
+    }
+
+async def run_transform(user_id: str, week_number: int, progress=no_progress, new_week_number: Optional[int] = None, on_allocate=None) -> dict:
+    # new_week_number is passed when a reclaimed job resumes a transform whose
+    # target week was already reserved; on_allocate records a fresh reservation
+    # Hold the source week so an approve or edit cannot change it mid-read
+    async with week_lease(user_id, week_number):
+        # Get current approved assignments
+        current_assignments = await load_week_assignments(user_id, week_number, approved=True)
+    
+    if not current_assignments:
+        raise HTTPException(status_code=404, detail="No approved assignments found for this week")
+    
+    # Get teachers, teacher schedules and school info for filtering
+    teachers = await db.teachers.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    teacher_schedules = await db.teacher_schedules.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    classrooms = await db.classrooms.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    await progress(10, "Veriler yüklendi")
+    
+    # Reserve the next week number; the reservation is atomic across workers
+    if new_week_number is None:
+        new_week_number = await allocate_week_number(user_id, week_number)
+        if on_allocate is not None:
+            await on_allocate(new_week_number)
+    
+    new_assignments = await run_in_process_pool(
+        plan_transformed_assignments, current_assignments, teachers, teacher_schedules, classrooms, new_week_number, user_id
+    )
+    await progress(60, "Nöbetler dönüştürüldü")
+    
+    if new_assignments:
+        async with week_lease(user_id, new_week_number):
+            # Drop rows a previous, interrupted attempt may have inserted so a
+            # retry replaces them instead of duplicating them
+            await db.duty_assignments.delete_many({
+                "user_id": user_id,
+                "week_number": new_week_number,
+                "transformed_from": {"$in": [a['id'] for a in current_assignments]}
+            })
+            await db.duty_assignments.insert_many(new_assignments)
+        await bump_collection_version(user_id, "duty_assignments")
+    
+    return {
+        "message": f"Transformed {len(new_assignments)} assignments to week {new_week_number}",
+        "new_week_number": new_week_number,
+        "count": len(new_assignments)
+    }
+
+async def run_export_pdf(user_id: str, week_number: int, progress=no_progress) -> bytes:
+    # Get approved assignments
+    assignments = await load_week_assignments(user_id, week_number, approved=True)
+    
+    if not assignments:
+        raise HTTPException(status_code=404, detail="No approved assignments found")
+    
+    # Get related data
+    teachers = await db.teachers.find({"user_id": user_id}, {"_id": 0, "id": 1, "name": 1}).to_list(1000)
+    classrooms = await db.classrooms.find({"user_id": user_id}, {"_id": 0, "id": 1, "name": 1}).to_list(1000)
+    await progress(20, "Veriler yüklendi")
+    
+    return await run_in_process_pool(render_assignments_pdf, assignments, teachers, classrooms, week_number)
+
+# ===== COLD STORAGE =====
+# Approved weeks older than the horizon are folded into one `archived_weeks`
+# document per (user, week): week-level fields plus an `entries` array of
+# [classroom_id, day, teacher_id, transformed_from, approved_at, created_at]
+# tuples (timestamps as epoch milliseconds) aligned with `assignment_ids`,
+# optionally zlib-compressed into `entries_blob`. Readers merge both tiers;
+# writes to an archived assignment thaw its week first, under the week's
+# lease, and a thawed week stays hot for another horizon.
+
+def encode_archive_entries(entries: list) -> dict:
+    if COLD_STORAGE_COMPRESSION == "zlib":
+        return {"compression": "zlib", "entries_blob": zlib.compress(json.dumps(entries, separators=(",", ":")).encode())}
+    return {"compression": None, "entries": entries}
+
+def decode_archive_entries(archived_week: dict) -> list:
+    if archived_week.get("compression") == "zlib":
+        return json.loads(zlib.decompress(archived_week["entries_blob"]))
+    return archived_week.get("entries", [])
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_epoch_ms(value: datetime) -> int:
+    # BSON dates carry milliseconds, so this is lossless for stored rows
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+def from_epoch_ms(value: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=value)
+
+def has_uniform_dates(rows: list) -> bool:
+    # An archived week stores a single date range, so only uniform weeks fold losslessly
+    return len({(r.get('start_date'), r.get('end_date')) for r in rows}) <= 1
+
+def build_archived_week(user_id: str, week_number: int, rows: list) -> dict:
+    first = rows[0]
+    entries = [
+        [r['classroom_id'], r['day'], r['teacher_id'], r.get('transformed_from'),
+         to_epoch_ms(r['approved_at']), to_epoch_ms(r['created_at'])]
+        for r in rows
+    ]
+    return {
+        "user_id": user_id,
+        "week_number": week_number,
+        "start_date": first.get('start_date'),
+        "end_date": first.get('end_date'),
+        "approved_at": max(r['approved_at'] for r in rows),
+        "transformed_from": first.get('transformed_from'),
+        "created_at": min(r['created_at'] for r in rows),
+        "count": len(rows),
+        "assignment_ids": [r['id'] for r in rows],
+        "compacted_at": datetime.now(timezone.utc),
+        **encode_archive_entries(entries),
+    }
+
+def expand_archived_week(archived_week: dict) -> list:
+    rows = []
+    for assignment_id, entry in zip(archived_week['assignment_ids'], decode_archive_entries(archived_week)):
+        classroom_id, day, teacher_id, transformed_from, *stamps = entry
+        # Weeks compacted before per-entry timestamps only have the week-level ones
+        approved_at, created_at = (
+            map(from_epoch_ms, stamps) if stamps
+            else (archived_week.get('approved_at'), archived_week.get('created_at'))
+        )
+        rows.append({
+            "id": assignment_id,
+            "teacher_id": teacher_id,
+            "classroom_id": classroom_id,
+            "day": day,
+            "week_number": archived_week['week_number'],
+            "start_date": archived_week.get('start_date'),
+            "end_date": archived_week.get('end_date'),
+            "approved": True,
+            "approved_at": approved_at,
+            "transformed_from": transformed_from,
+            "user_id": archived_week['user_id'],
+            "created_at": created_at,
+        })
+    return rows
+
+def merge_tiers(hot: list, cold: list) -> list:
+    # Hot rows win: a row can exist in both tiers only transiently
+    hot_ids = {a['id'] for a in hot}
+    return hot + [a for a in cold if a['id'] not in hot_ids]
+
+async def load_week_assignments(user_id: str, week_number: int, approved: Optional[bool] = None) -> list:
+    query = {"user_id": user_id, "week_number": week_number}
+    if approved is not None:
+        query["approved"] = approved
+    assignments = await db.duty_assignments.find(query, {"_id": 0}).to_list(10000)
+    if approved is False:
+        return assignments
+    archived_week = await db.archived_weeks.find_one({"user_id": user_id, "week_number": week_number}, {"_id": 0})
+    if archived_week:
+        assignments = merge_tiers(assignments, expand_archived_week(archived_week))
+    return assignments
+
+async def get_max_week_number(user_id: str) -> Optional[int]:
+    weeks = []
+    for collection in (db.duty_assignments, db.archived_weeks):
+        latest = await collection.find_one({"user_id": user_id}, {"_id": 0, "week_number": 1}, sort=[("week_number", -1)])
+        if latest:
+            weeks.append(latest['week_number'])
+    return max(weeks, default=None)
+
+async def thaw_week(user_id: str, week_number: int):
+    """Move an archived week back into duty_assignments. The caller holds the week's lease."""
+    archived_week = await db.archived_weeks.find_one({"user_id": user_id, "week_number": week_number}, {"_id": 0})
+    if not archived_week:
+        return
+    hot_ids = set(await db.duty_assignments.distinct("id", {"user_id": user_id, "week_number": week_number}))
+    # thawed_at keeps compaction off the week for another horizon
+    now = datetime.now(timezone.utc)
+    rows = [{**a, "thawed_at": now} for a in expand_archived_week(archived_week) if a['id'] not in hot_ids]
+    if rows:
+        await db.duty_assignments.insert_many(rows)
+    await db.archived_weeks.delete_one({"user_id": user_id, "week_number": week_number})
+
+async def write_assignment(user_id: str, assignment_id: str, write) -> bool:
+    """Run write(query) on an assignment in either tier while holding its week's lease.
+    
+    Compaction holds the same lease from reading a week's rows to deleting
+    them, so an edit can neither be lost in that window nor resurrect a
+    deleted row in the archive.
+    """
+    hot = await db.duty_assignments.find_one({"user_id": user_id, "id": assignment_id}, {"_id": 0, "week_number": 1, "approved": 1})
+    if hot and not hot['approved']:
+        # Compaction skips weeks with unapproved rows, so drafts need no lease
+        return await write({"id": assignment_id, "user_id": user_id, "week_number": hot['week_number'], "approved": False})
+    if hot:
+        week_number = hot['week_number']
+    else:
+        cold = await db.archived_weeks.find_one({"user_id": user_id, "assignment_ids": assignment_id}, {"_id": 0, "week_number": 1})
+        if not cold:
+            return False
+        week_number = cold['week_number']
+    async with week_lease(user_id, week_number):
+        if await db.archived_weeks.find_one(
+            {"user_id": user_id, "week_number": week_number, "assignment_ids": assignment_id}, {"_id": 1}
+        ):
+            await thaw_week(user_id, week_number)
+        # week_number in the query: a row moved to another week meanwhile is not ours to touch
+        return await write({"id": assignment_id, "user_id": user_id, "week_number": week_number})
+
+async def run_compact_archive(user_id: str, progress=no_progress) -> dict:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=COLD_STORAGE_HORIZON_DAYS)
+    # Fully approved weeks, last approved before the cutoff, with uniform dates
+    candidates = await db.duty_assignments.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$group": {
+            "_id": "$week_number",
+            "unapproved": {"$sum": {"$cond": ["$approved", 0, 1]}},
+            # Rows still holding string timestamps wait for the migration
+            "string_timestamps": {"$sum": {"$cond": [
+                {"$or": [
+                    {"$ne": [{"$type": "$approved_at"}, "date"]},
+                    {"$ne": [{"$type": "$created_at"}, "date"]}
+                ]}, 1, 0
+            ]}},
+            "last_approved_at": {"$max": "$approved_at"},
+            "last_thawed_at": {"$max": "$thawed_at"},
+            "start_dates": {"$addToSet": "$start_date"},
+            "end_dates": {"$addToSet": "$end_date"}
+        }},
+        {"$match": {
+            "unapproved": 0,
+            "string_timestamps": 0,
+            "last_approved_at": {"$lt": cutoff},
+            # Recently thawed weeks are being edited; leave them hot
+            "$or": [{"last_thawed_at": None}, {"last_thawed_at": {"$lt": cutoff}}],
+            "start_dates.1": {"$exists": False},
+            "end_dates.1": {"$exists": False}
+        }},
+        {"$sort": {"_id": 1}}
+    ]).to_list(None)
+    
+    compacted_weeks = []
+    compacted_assignments = 0
+    for i, candidate in enumerate(candidates):
+        # Each week is written before its hot rows are removed, so cancelling
+        # between weeks never loses data
+        await progress(int(80 * i / len(candidates)), f"Hafta {candidate['_id']} arşivleniyor")
+        week_number = candidate['_id']
+        async with week_lease(user_id, week_number):
+            rows = await db.duty_assignments.find({"user_id": user_id, "week_number": week_number}, {"_id": 0}).to_list(None)
+            # The week may have been regenerated since the candidate scan
+            if not rows or not all(r['approved'] for r in rows):
+                continue
+            if any(r.get('thawed_at') and r['thawed_at'] >= cutoff for r in rows):
+                continue
+            existing = await db.archived_weeks.find_one({"user_id": user_id, "week_number": week_number}, {"_id": 0})
+            merged = merge_tiers(rows, expand_archived_week(existing)) if existing else rows
+            # Rows may have been re-dated since the scan, or differ from an
+            # already archived part of the week
+            if not has_uniform_dates(merged):
+                continue
+            await db.archived_weeks.replace_one(
+                {"user_id": user_id, "week_number": week_number},
+                build_archived_week(user_id, week_number, merged),
+                upsert=True
+            )
+            await db.duty_assignments.delete_many(
+                {"user_id": user_id, "week_number": week_number, "id": {"$in": [r['id'] for r in rows]}}
+            )
+        compacted_weeks.append(week_number)
+        compacted_assignments += len(rows)
+    
+    # Orphans left behind by delete_teacher / delete_classroom. Approved
+    # history is kept (reports already show unknown names for it).
+    await progress(90, "Sahipsiz kayıtlar temizleniyor")
+    teacher_ids = await db.teachers.distinct("id", {"user_id": user_id})
+    classroom_ids = await db.classrooms.distinct("id", {"user_id": user_id})
+    orphaned_assignments = await db.duty_assignments.delete_many({
+        "user_id": user_id,
+        "approved": False,
+        "$or": [{"teacher_id": {"$nin": teacher_ids}}, {"classroom_id": {"$nin": classroom_ids}}]
+    })
+    orphaned_schedules = await db.teacher_schedules.delete_many(
+        {"user_id": user_id, "teacher_id": {"$nin": teacher_ids}}
+    )
+    orphaned_school_duties = await db.school_duties.delete_many(
+        {"user_id": user_id, "teacher_id": {"$nin": teacher_ids}}
+    )
+    
+    if compacted_weeks or orphaned_assignments.deleted_count:
+        await bump_collection_version(user_id, "duty_assignments")
+    if orphaned_schedules.deleted_count:
+        await bump_collection_version(user_id, "teacher_schedules")
+    if orphaned_school_duties.deleted_count:
+        await bump_collection_version(user_id, "school_duties")
+    
+    return {
+        "message": f"Compacted {len(compacted_weeks)} weeks ({compacted_assignments} assignments)",
+        "compacted_weeks": compacted_weeks,
+        "compacted_assignments": compacted_assignments,
+        "orphaned_assignments_removed": orphaned_assignments.deleted_count,
+        "orphaned_schedules_removed": orphaned_schedules.deleted_count,
+        "orphaned_school_duties_removed": orphaned_school_duties.deleted_count
+    }
+
+# ===== DUTY ASSIGNMENT ENDPOINTS =====
+
+@api_router.post("/duty-assignments/generate")
+async def generate_duty_assignments(week_number: int, current_user: User = Depends(get_current_user)):
+    return await run_generate(current_user.id, week_number)
+
+@api_router.post("/duty-assignments/simulate")
+async def simulate_duty_assignments(simulation: SimulationRequest, current_user: User = Depends(get_current_user)):
+    # Dry run: one snapshot, every variant scored in the process pool, nothing written
+    teachers = await db.teachers.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
+    teacher_schedules = await db.teacher_schedules.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
+    classrooms = await db.classrooms.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
+    
+    # A mistyped teacher id would otherwise make the variant a silent no-op
+    teacher_ids = {t['id'] for t in teachers}
+    for i, variant in enumerate(simulation.variants):
+        for field in ("weekly_duty_limits", "excluded_days"):
+            unknown = sorted(set(getattr(variant, field)) - teacher_ids)
+            if unknown:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"Variant {variant.name or i + 1}: unknown teacher ids in {field}: {', '.join(unknown)}"
+                )
+    
+    variants = [{"name": "baseline"}] + [v.model_dump() for v in simulation.variants]
+    results = await asyncio.gather(*[
+        run_in_process_pool(
+            simulate_variant, teachers, teacher_schedules, classrooms, variant, simulation.week_number, current_user.id
+        )
+        for variant in variants
+    ])
+    
+    return json_response({
+        "week_number": simulation.week_number,
+        "baseline": results[0],
+        "variants": results[1:]
+    })
+
+@api_router.get("/duty-assignments")
+async def get_duty_assignments(
+    week_number: int,
+    request: Request,
+    approved: Optional[bool] = None,
+    current_user: User = Depends(get_current_user)
+):
+    headers = await collection_etag_headers(current_user.id, "duty_assignments", week_number, approved)
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    
+    assignments = await load_week_assignments(current_user.id, week_number, approved)
+    return json_response(assignments, headers=headers)
+
+@api_router.post("/duty-assignments", response_model=DutyAssignment)
+async def create_duty_assignment(assignment_data: DutyAssignmentCreate, current_user: User = Depends(get_current_user)):
+    assignment = DutyAssignment(**assignment_data.model_dump(), user_id=current_user.id)
+    doc = assignment.model_dump()
+    await db.duty_assignments.insert_one(doc)
+    await bump_collection_version(current_user.id, "duty_assignments")
+    return assignment
+
+@api_router.put("/duty-assignments/{assignment_id}")
+async def update_duty_assignment(
+    assignment_id: str, 
+    assignment_data: DutyAssignmentCreate, 
+    current_user: User = Depends(get_current_user)
+):
+    async def update(query):
+        result = await db.duty_assignments.update_one(query, {"$set": assignment_data.model_dump()})
+        return result.modified_count > 0
+    
+    if not await write_assignment(current_user.id, assignment_id, update):
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    await bump_collection_version(current_user.id, "duty_assignments")
+    return {"message": "Assignment updated"}
+
+@api_router.delete("/duty-assignments/{assignment_id}")
+async def delete_duty_assignment(assignment_id: str, current_user: User = Depends(get_current_user)):
+    async def delete(query):
+        result = await db.duty_assignments.delete_one(query)
+        return result.deleted_count > 0
+    
+    if not await write_assignment(current_user.id, assignment_id, delete):
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    await bump_collection_version(current_user.id, "duty_assignments")
+    return {"message": "Assignment deleted"}
+
+@api_router.post("/duty-assignments/approve")
+async def approve_duty_assignments(week_number: int, current_user: User = Depends(get_current_user)):
+    async with week_lease(current_user.id, week_number):
+        result = await db.duty_assignments.update_many(
+            {"user_id": current_user.id, "week_number": week_number, "approved": False},
+            {"$set": {"approved": True, "approved_at": datetime.now(timezone.utc)}}
+        )
+    if result.modified_count:
+        await bump_collection_version(current_user.id, "duty_assignments")
+    return {"message": f"Approved {result.modified_count} duty assignments"}
+
+@api_router.post("/duty-assignments/transform")
+async def transform_duty_assignments(week_number: int, current_user: User = Depends(get_current_user)):
+    return await run_transform(current_user.id, week_number)
+
+@api_router.put("/duty-assignments/archive/{week_number}")
+async def update_archived_assignment(
+    week_number: int,
+    assignment_id: str,
+    assignment_data: DutyAssignmentCreate,
+    current_user: User = Depends(get_current_user)
+):
+    async def update(query):
+        query = {**query, "week_number": week_number, "approved": True}
+        result = await db.duty_assignments.update_one(query, {"$set": assignment_data.model_dump()})
+        return result.modified_count > 0
+    
+    if not await write_assignment(current_user.id, assignment_id, update):
+        raise HTTPException(status_code=404, detail="Assignment not found or not approved")
+    await bump_collection_version(current_user.id, "duty_assignments")
+    return {"message": "Assignment updated"}
+
+@api_router.get("/duty-assignments/export-pdf")
+async def export_duty_assignments_pdf(week_number: int, current_user: User = Depends(get_current_user)):
+    pdf = await run_export_pdf(current_user.id, week_number)
     return StreamingResponse(
-        buffer,
+        BytesIO(pdf),
         media_type="application/pdf",
         headers={"Content-Disposition": f"attachment; filename=nobet_hafta_{week_number}.pdf"}
     )
 
 @api_router.get("/duty-assignments/archive")
 async def get_archived_assignments(current_user: User = Depends(get_current_user)):
-    # Get all approved assignments grouped by week
+    # Archived weeks come pre-summarized from the cold tier
+    archived_weeks = await db.archived_weeks.find(
+        {"user_id": current_user.id},
+        {"_id": 0, "week_number": 1, "approved_at": 1, "transformed_from": 1, "start_date": 1, "end_date": 1, "count": 1}
+    ).to_list(None)
+    weeks = {w['week_number']: w for w in archived_weeks}
+    
+    # Get recent approved assignments grouped by week
     assignments = await db.duty_assignments.find(
         {"user_id": current_user.id, "approved": True},
         {"_id": 0}
     ).to_list(10000)
     
     # Group by week
-    weeks = {}
     for assignment in assignments:
         week = assignment['week_number']
         if week not in weeks:
@@ -731,7 +1475,7 @@ async def get_archived_assignments(current_user: User = Depends(get_current_user
             }
         weeks[week]['count'] += 1
     
-    return list(weeks.values())
+    return json_response(list(weeks.values()))
 
 @api_router.get("/duty-assignments/statistics")
 async def get_duty_statistics(
@@ -749,6 +1493,11 @@ async def get_duty_statistics(
     
     assignments = await db.duty_assignments.find(query, {"_id": 0}).to_list(10000)
     
+    # Archived weeks share the week-level date fields, so the same filter applies
+    query.pop("approved")
+    async for archived_week in db.archived_weeks.find(query, {"_id": 0}):
+        assignments.extend(expand_archived_week(archived_week))
+    
     # Get teachers and classrooms
     teachers = await db.teachers.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
     classrooms = await db.classrooms.find({"user_id": current_user.id}, {"_id": 0}).to_list(1000)
@@ -780,7 +1529,7 @@ async def get_duty_statistics(
                 "end": assignment['end_date']
             })
     
-    return list(stats.values())
+    return json_response(list(stats.values()))
 
 # ===== SCHOOL DUTY ENDPOINTS =====
 
@@ -788,8 +1537,8 @@ async def get_duty_statistics(
 async def create_school_duty(duty_data: SchoolDutyCreate, current_user: User = Depends(get_current_user)):
     duty = SchoolDuty(**duty_data.model_dump(), user_id=current_user.id)
     doc = duty.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.school_duties.insert_one(doc)
+    await bump_collection_version(current_user.id, "school_duties")
     return duty
 
 @api_router.get("/school-duties")
@@ -798,20 +1547,535 @@ async def get_school_duties(month: int, year: int, current_user: User = Depends(
         {"user_id": current_user.id, "month": month, "year": year}, 
         {"_id": 0}
     ).to_list(1000)
-    
-    for duty in duties:
-        if isinstance(duty.get('created_at'), str):
-            duty['created_at'] = datetime.fromisoformat(duty['created_at'])
-    
-    return duties
+    return json_response(duties)
 
 @api_router.delete("/school-duties/{duty_id}")
 async def delete_school_duty(duty_id: str, current_user: User = Depends(get_current_user)):
     result = await db.school_duties.delete_one({"id": duty_id, "user_id": current_user.id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="School duty not found")
+    await bump_collection_version(current_user.id, "school_duties")
     return {"message": "School duty deleted"}
 
+# ===== CALENDAR FEEDS =====
+# Each teacher has a `teacher_feeds` document holding a secret token and
+# the fully rendered iCal and CSV bodies. Feeds are rebuilt per tenant in
+# the background whenever a source collection's version is bumped, so
+# polling calendar clients only ever hit one indexed lookup by token.
+
+FEED_SOURCE_COLLECTIONS = {"duty_assignments", "school_duties", "teachers", "classrooms"}
+SCHOOL_DUTY_LABELS = {"entrance": "Giriş Nöbeti", "exit": "Çıkış Nöbeti", "yard": "Bahçe Nöbeti"}
+FEED_ASSIGNMENT_FIELDS = ("id", "teacher_id", "classroom_id", "day", "week_number", "start_date", "approved_at")
+feed_rebuild_tasks: Dict[str, asyncio.Task] = {}
+feed_rebuild_dirty: set = set()
+# (user_id, week_number) -> (compacted_at, rows); an archived week does not
+# change until it is thawed or re-compacted, which changes compacted_at
+archived_feed_rows: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+def parse_feed_date(value: Optional[str]) -> Optional[date]:
+    # Week dates come from <input type="date">; school duty dates are typed by hand
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+def feed_stamp(value, fallback: date) -> datetime:
+    # DTSTAMP comes from the data (approval / creation time) rather than the
+    # rebuild time, so an unchanged feed renders byte-for-byte identically
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = None
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return datetime(fallback.year, fallback.month, fallback.day, tzinfo=timezone.utc)
+
+def ical_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def ical_fold(line: str) -> str:
+    # RFC 5545: lines longer than 75 octets continue on lines starting with a space
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        cut = min(len(encoded), 75 if not parts else 74)
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1  # Do not split a UTF-8 sequence
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+    return "\r\n ".join(parts)
+
+def render_teacher_ical(teacher_name: str, events: list) -> str:
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//EduNobet//Nobet Takvimi//TR",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{ical_escape(teacher_name)} - Nöbetler",
+    ]
+    for event in events:
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{event['uid']}@edunobet",
+            f"DTSTAMP:{event['stamp'].strftime('%Y%m%dT%H%M%SZ')}",
+            f"DTSTART;VALUE=DATE:{event['date'].strftime('%Y%m%d')}",
+            f"DTEND;VALUE=DATE:{(event['date'] + timedelta(days=1)).strftime('%Y%m%d')}",
+            f"SUMMARY:{ical_escape(event['summary'])}",
+            f"LOCATION:{ical_escape(event['location'])}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(ical_fold(line) for line in lines) + "\r\n"
+
+def feed_etag(body: str) -> str:
+    return f'"{hashlib.sha1(body.encode()).hexdigest()}"'
+
+def render_teacher_csv(events: list) -> str:
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Tarih", "Gün", "Nöbet", "Yer", "Hafta"])
+    for event in events:
+        writer.writerow([
+            event['date'].isoformat(),
+            DAY_NAMES[event['date'].weekday()] if event['date'].weekday() < 5 else "",
+            event['summary'],
+            event['location'],
+            event.get('week_number', ""),
+        ])
+    return buffer.getvalue()
+
+async def load_archived_feed_rows(user_id: str) -> list:
+    """Feed fields of every archived assignment, decompressed once per compaction."""
+    summaries = await db.archived_weeks.find(
+        {"user_id": user_id}, {"_id": 0, "week_number": 1, "compacted_at": 1}
+    ).to_list(None)
+    stale = [
+        w['week_number'] for w in summaries
+        if archived_feed_rows.get((user_id, w['week_number']), (None,))[0] != w['compacted_at']
+    ]
+    if stale:
+        async for archived_week in db.archived_weeks.find({"user_id": user_id, "week_number": {"$in": stale}}, {"_id": 0}):
+            archived_feed_rows[(user_id, archived_week['week_number'])] = (
+                archived_week['compacted_at'],
+                [{field: a[field] for field in FEED_ASSIGNMENT_FIELDS} for a in expand_archived_week(archived_week)]
+            )
+    rows = []
+    for w in summaries:
+        key = (user_id, w['week_number'])
+        if key in archived_feed_rows:
+            archived_feed_rows.move_to_end(key)
+            rows.extend(archived_feed_rows[key][1])
+    while len(archived_feed_rows) > FEED_ARCHIVE_CACHE_WEEKS:
+        archived_feed_rows.popitem(last=False)
+    return rows
+
+async def rebuild_teacher_feeds(user_id: str, teacher_id: Optional[str] = None):
+    # teacher_id limits the rebuild to one teacher (first render of a new feed)
+    scope = {"user_id": user_id} if teacher_id is None else {"user_id": user_id, "teacher_id": teacher_id}
+    teachers = await db.teachers.find(
+        {"user_id": user_id} if teacher_id is None else {"user_id": user_id, "id": teacher_id},
+        {"_id": 0, "id": 1, "name": 1}
+    ).to_list(1000)
+    classrooms = await db.classrooms.find({"user_id": user_id}, {"_id": 0, "id": 1, "name": 1}).to_list(1000)
+    classroom_map = {c['id']: c['name'] for c in classrooms}
+    events = {t['id']: [] for t in teachers}
+    
+    # Approved duties from both storage tiers; hot rows win on id
+    assignments = {a['id']: a for a in await load_archived_feed_rows(user_id) if a['teacher_id'] in events}
+    async for a in db.duty_assignments.find(
+        {**scope, "approved": True},
+        {"_id": 0, **{field: 1 for field in FEED_ASSIGNMENT_FIELDS}}
+    ):
+        assignments[a['id']] = a
+    for a in assignments.values():
+        week_start = parse_feed_date(a.get('start_date'))
+        # Undated weeks cannot be placed on a calendar
+        if a['teacher_id'] not in events or week_start is None:
+            continue
+        location = classroom_map.get(a['classroom_id'], 'Bilinmeyen')
+        events[a['teacher_id']].append({
+            "uid": a['id'],
+            "date": week_start + timedelta(days=a['day']),
+            "stamp": feed_stamp(a.get('approved_at'), week_start),
+            "summary": f"Nöbet: {location}",
+            "location": location,
+            "week_number": a['week_number'],
+        })
+    
+    async for duty in db.school_duties.find(scope, {"_id": 0}):
+        if duty['teacher_id'] not in events:
+            continue
+        label = SCHOOL_DUTY_LABELS.get(duty['duty_type'], duty['duty_type'])
+        for raw_date in duty['dates']:
+            duty_date = parse_feed_date(raw_date)
+            if duty_date is None:
+                continue
+            events[duty['teacher_id']].append({
+                "uid": f"{duty['id']}-{duty_date.isoformat()}",
+                "date": duty_date,
+                "stamp": feed_stamp(duty.get('created_at'), duty_date),
+                "summary": label,
+                "location": "Okul",
+            })
+    
+    # Only feeds whose rendered body changed are written, so their ETags (and
+    # polling clients' 304s) survive unrelated writes
+    current = {
+        f['teacher_id']: (f.get('ics_etag'), f.get('csv_etag'))
+        async for f in db.teacher_feeds.find(scope, {"_id": 0, "teacher_id": 1, "ics_etag": 1, "csv_etag": 1})
+    }
+    now = datetime.now(timezone.utc)
+    ops = []
+    for teacher in teachers:
+        teacher_events = sorted(events[teacher['id']], key=lambda e: (e['date'], e['summary'], e['uid']))
+        ics = render_teacher_ical(teacher['name'], teacher_events)
+        csv_body = render_teacher_csv(teacher_events)
+        etags = (feed_etag(ics), feed_etag(csv_body))
+        if current.get(teacher['id']) == etags:
+            continue
+        ops.append(UpdateOne(
+            {"user_id": user_id, "teacher_id": teacher['id']},
+            {
+                "$set": {"ics": ics, "ics_etag": etags[0], "csv": csv_body, "csv_etag": etags[1], "updated_at": now},
+                "$setOnInsert": {"token": secrets.token_urlsafe(24)}
+            },
+            upsert=True
+        ))
+    if ops:
+        try:
+            await db.teacher_feeds.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # A concurrent rebuild or token request inserted some of the same
+            # feeds first; those documents exist now, so the retry updates them
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+            await db.teacher_feeds.bulk_write(ops, ordered=False)
+    if teacher_id is None:
+        await db.teacher_feeds.delete_many({"user_id": user_id, "teacher_id": {"$nin": [t['id'] for t in teachers]}})
+
+async def feed_rebuild_loop(user_id: str):
+    try:
+        while True:
+            # Coalesce bursts of writes into one rebuild
+            await asyncio.sleep(FEED_REBUILD_DELAY)
+            feed_rebuild_dirty.discard(user_id)
+            await rebuild_teacher_feeds(user_id)
+            if user_id not in feed_rebuild_dirty:
+                break
+    except Exception:
+        logger.exception("Calendar feed rebuild failed for user %s", user_id)
+    finally:
+        feed_rebuild_tasks.pop(user_id, None)
+
+def schedule_feed_rebuild(user_id: str):
+    if user_id in feed_rebuild_tasks:
+        feed_rebuild_dirty.add(user_id)
+        return
+    feed_rebuild_tasks[user_id] = asyncio.create_task(feed_rebuild_loop(user_id))
+
+async def stop_feed_rebuilds():
+    tasks = list(feed_rebuild_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def feed_urls(request: Request, token: str) -> dict:
+    # Absolute, so the URL can be pasted into a calendar app as-is
+    return {
+        "token": token,
+        "ics_url": str(request.url_for("get_calendar_ics", token=token)),
+        "csv_url": str(request.url_for("get_calendar_csv", token=token))
+    }
+
+async def serve_feed(request: Request, token: str, fmt: str, media_type: str) -> Response:
+    feed = await db.teacher_feeds.find_one({"token": token}, {"_id": 0, fmt: 1, f"{fmt}_etag": 1})
+    if not feed:
+        raise HTTPException(status_code=404, detail="Calendar feed not found")
+    if fmt not in feed:
+        # Token issued, first render still pending
+        raise HTTPException(status_code=503, detail="Calendar feed is being prepared", headers={"Retry-After": "5"})
+    headers = {"ETag": feed[f"{fmt}_etag"], "Cache-Control": "private, max-age=300"}
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    body = feed[fmt]
+    if fmt == "csv":
+        body = "\ufeff" + body  # BOM so spreadsheet apps read Turkish characters correctly
+    return Response(content=body, media_type=media_type, headers=headers)
+
+# ===== CALENDAR FEED ENDPOINTS =====
+
+@api_router.get("/teachers/{teacher_id}/calendar-feed")
+async def get_teacher_calendar_feed(teacher_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    teacher = await db.teachers.find_one({"id": teacher_id, "user_id": current_user.id}, {"_id": 0, "id": 1})
+    if not teacher:
+        raise HTTPException(status_code=404, detail="Teacher not found")
+    feed = await db.teacher_feeds.find_one({"user_id": current_user.id, "teacher_id": teacher_id}, {"_id": 0, "token": 1})
+    if not feed:
+        # First request for this teacher: render just its feed. The upsert
+        # tolerates a concurrent tenant-wide rebuild inserting it first.
+        await rebuild_teacher_feeds(current_user.id, teacher_id)
+        feed = await db.teacher_feeds.find_one({"user_id": current_user.id, "teacher_id": teacher_id}, {"_id": 0, "token": 1})
+    if not feed:
+        # The teacher was deleted meanwhile
+        raise HTTPException(status_code=404, detail="Teacher not found")
+    return feed_urls(request, feed["token"])
+
+@api_router.post("/teachers/{teacher_id}/calendar-feed/rotate")
+async def rotate_teacher_calendar_feed(teacher_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    feed = await db.teacher_feeds.find_one_and_update(
+        {"user_id": current_user.id, "teacher_id": teacher_id},
+        {"$set": {"token": secrets.token_urlsafe(24)}},
+        projection={"_id": 0, "token": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not feed:
+        raise HTTPException(status_code=404, detail="Calendar feed not found")
+    return feed_urls(request, feed["token"])
+
+# Public: the unguessable token is the credential, so calendar apps can subscribe
+@api_router.get("/calendar/{token}.ics")
+async def get_calendar_ics(token: str, request: Request):
+    return await serve_feed(request, token, "ics", "text/calendar; charset=utf-8")
+
+@api_router.get("/calendar/{token}.csv")
+async def get_calendar_csv(token: str, request: Request):
+    return await serve_feed(request, token, "csv", "text/csv; charset=utf-8")
+
+# ===== BACKGROUND JOBS =====
+# Jobs live in the `jobs` collection so any worker can claim them and
+# clients can poll status from any worker. While a job is queued or running
+# it carries an `active_key` (unique, sparse index) that deduplicates
+# identical submissions; the key is removed when the job finishes. Running
+# jobs heartbeat, so a job orphaned by a dead worker is claimed again.
+
+class JobCancelled(Exception):
+    pass
+
+async def job_generate(job: dict, progress) -> dict:
+    return await run_generate(job["user_id"], job["params"]["week_number"], progress)
+
+async def job_transform(job: dict, progress) -> dict:
+    # Persist the reserved week before writing it, so a reclaimed job
+    # refills the same week rather than allocating a second one
+    async def remember_week(new_week_number: int):
+        await db.jobs.update_one({"id": job["id"]}, {"$set": {"new_week_number": new_week_number}})
+    
+    return await run_transform(
+        job["user_id"], job["params"]["week_number"], progress,
+        new_week_number=job.get("new_week_number"), on_allocate=remember_week
+    )
+
+async def job_export_pdf(job: dict, progress) -> dict:
+    week_number = job["params"]["week_number"]
+    pdf = await run_export_pdf(job["user_id"], week_number, progress)
+    return {
+        "filename": f"nobet_hafta_{week_number}.pdf",
+        "media_type": "application/pdf",
+        "content": pdf,
+    }
+
+async def job_compact_archive(job: dict, progress) -> dict:
+    return await run_compact_archive(job["user_id"], progress)
+
+JOB_HANDLERS = {
+    "generate": job_generate,
+    "transform": job_transform,
+    "export-pdf": job_export_pdf,
+    "compact-archive": job_compact_archive,
+}
+
+async def submit_job(user_id: str, kind: str, params: dict) -> dict:
+    active_key = f"{user_id}:{kind}:{json.dumps(params, sort_keys=True)}"
+    for _ in range(2):
+        job = Job(kind=kind, params=params, user_id=user_id)
+        doc = job.model_dump()
+        doc['active_key'] = active_key
+        try:
+            await db.jobs.insert_one(doc)
+        except DuplicateKeyError:
+            existing = await db.jobs.find_one({"active_key": active_key}, {"_id": 0, "id": 1, "status": 1})
+            if existing is None:
+                # The in-flight duplicate finished in between; try again
+                continue
+            return {"job_id": existing["id"], "status": existing["status"], "deduplicated": True}
+        if job_wakeup is not None:
+            job_wakeup.set()
+        return {"job_id": job.id, "status": job.status, "deduplicated": False}
+    raise HTTPException(status_code=409, detail="Could not submit job, please retry")
+
+async def claim_next_job() -> Optional[dict]:
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=JOB_STALE_SECONDS)
+    return await db.jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "heartbeat_at": {"$lt": stale}}
+        ]},
+        {"$set": {"status": "running", "started_at": now, "heartbeat_at": now}},
+        sort=[("created_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def finish_job(job_id: str, status: str, **fields):
+    await db.jobs.update_one(
+        {"id": job_id},
+        {
+            "$set": {"status": status, "finished_at": datetime.now(timezone.utc), **fields},
+            "$unset": {"active_key": ""}
+        }
+    )
+
+async def execute_job(job: dict):
+    job_id = job["id"]
+    
+    async def progress(percent: int, message: Optional[str] = None):
+        current = await db.jobs.find_one_and_update(
+            {"id": job_id},
+            {"$set": {"progress": percent, "message": message}},
+            projection={"_id": 0, "cancel_requested": 1}
+        )
+        if current and current.get("cancel_requested"):
+            raise JobCancelled()
+    
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            await db.jobs.update_one({"id": job_id}, {"$set": {"heartbeat_at": datetime.now(timezone.utc)}})
+    
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        result = await JOB_HANDLERS[job["kind"]](job, progress)
+    except JobCancelled:
+        await finish_job(job_id, "cancelled")
+    except HTTPException as e:
+        await finish_job(job_id, "failed", error=e.detail)
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job_id, job["kind"])
+        await finish_job(job_id, "failed", error=str(e))
+    else:
+        await finish_job(job_id, "succeeded", progress=100, result=result)
+    finally:
+        heartbeat_task.cancel()
+
+async def job_worker():
+    while True:
+        try:
+            job = await claim_next_job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Could not claim job")
+            job = None
+        if job is not None:
+            try:
+                await execute_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # e.g. finish_job hitting a transient Mongo error; the job's
+                # heartbeat stops, so it is reclaimed once it goes stale
+                logger.exception("Job %s (%s) could not be finished", job["id"], job["kind"])
+            continue
+        job_wakeup.clear()
+        try:
+            await asyncio.wait_for(job_wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+def start_job_workers():
+    global job_wakeup, process_pool
+    job_wakeup = asyncio.Event()
+    process_pool = ProcessPoolExecutor(
+        max_workers=JOB_PROCESS_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    for _ in range(JOB_CONCURRENCY):
+        job_worker_tasks.append(asyncio.create_task(job_worker()))
+
+async def stop_job_workers():
+    global process_pool
+    for task in job_worker_tasks:
+        task.cancel()
+    await asyncio.gather(*job_worker_tasks, return_exceptions=True)
+    job_worker_tasks.clear()
+    if process_pool is not None:
+        process_pool.shutdown(wait=False, cancel_futures=True)
+        process_pool = None
+
+# ===== JOB ENDPOINTS =====
+
+@api_router.post("/jobs/duty-assignments/generate")
+async def submit_generate_job(week_number: int, current_user: User = Depends(get_current_user)):
+    return await submit_job(current_user.id, "generate", {"week_number": week_number})
+
+@api_router.post("/jobs/duty-assignments/transform")
+async def submit_transform_job(week_number: int, current_user: User = Depends(get_current_user)):
+    return await submit_job(current_user.id, "transform", {"week_number": week_number})
+
+@api_router.post("/jobs/duty-assignments/export-pdf")
+async def submit_export_pdf_job(week_number: int, current_user: User = Depends(get_current_user)):
+    return await submit_job(current_user.id, "export-pdf", {"week_number": week_number})
+
+@api_router.post("/jobs/archive/compact")
+async def submit_compact_archive_job(current_user: User = Depends(get_current_user)):
+    return await submit_job(current_user.id, "compact-archive", {})
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await db.jobs.find_one(
+        {"id": job_id, "user_id": current_user.id},
+        {"_id": 0, "active_key": 0, "result.content": 0}
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return json_response(job)
+
+@api_router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await db.jobs.find_one({"id": job_id, "user_id": current_user.id}, {"_id": 0, "status": 1, "result": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    result = job.get("result") or {}
+    if "content" in result:
+        return Response(
+            content=bytes(result["content"]),
+            media_type=result["media_type"],
+            headers={"Content-Disposition": f"attachment; filename={result['filename']}"}
+        )
+    return json_response(result)
+
+@api_router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, current_user: User = Depends(get_current_user)):
+    # Queued jobs are cancelled outright; running ones are flagged and stop
+    # at their next progress checkpoint, before anything is written
+    result = await db.jobs.update_one(
+        {"id": job_id, "user_id": current_user.id, "status": "queued"},
+        {
+            "$set": {"status": "cancelled", "cancel_requested": True, "finished_at": datetime.now(timezone.utc)},
+            "$unset": {"active_key": ""}
+        }
+    )
+    if result.modified_count:
+        return {"message": "Job cancelled"}
+    result = await db.jobs.update_one(
+        {"id": job_id, "user_id": current_user.id, "status": "running"},
+        {"$set": {"cancel_requested": True}}
+    )
+    if result.matched_count:
+        return {"message": "Cancellation requested"}
+    job = await db.jobs.find_one({"id": job_id, "user_id": current_user.id}, {"_id": 0, "status": 1})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+
 # Include router
 app.include_router(api_router)
 
@@ -827,8 +2091,4 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+logger = logging.getLogger(__name__)
\ No newline at end of file
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { runJob } from '@/lib/jobs';
 import { Button } from '@/components/ui/button';
 import { Label } from '@/components/ui/label';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
@@ -126,7 +127,7 @@ export default function ArchiveTab() {
 
   const downloadPDF = async (weekNumber) => {
     try {
-      const response = await axios.get(`${API}/duty-assignments/export-pdf?week_number=${weekNumber}`, {
+      const response = await runJob(`duty-assignments/export-pdf?week_number=${weekNumber}`, {
         responseType: 'blob'
       });
       const url = window.URL.createObjectURL(new Blob([response.data]));
@@ -156,7 +157,7 @@ export default function ArchiveTab() {
     if (!window.confirm('Bu nöbet çizelgesini ders programına göre dönüştürmek istediğinizden emin misiniz? Yeni bir arşiv kaydı oluşturulacak.')) return;
     setTransforming(true);
     try {
-      const response = await axios.post(`${API}/duty-assignments/transform?week_number=${weekNumber}`);
+      const response = await runJob(`duty-assignments/transform?week_number=${weekNumber}`);
       toast.success(`Nöbet dönüştürüldü! Yeni hafta numarası: ${response.data.new_week_number}. Arşivde yeni kayıt olarak görebilirsiniz.`);
       await fetchArchives();
     } catch (error) {
@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import axios from 'axios';
 import { API } from '@/App';
+import { runJob } from '@/lib/jobs';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
@@ -73,7 +74,7 @@ export default function DutyAssignmentsTab() {
     }
     setLoading(true);
     try {
-      const response = await axios.post(`${API}/duty-assignments/generate?week_number=${weekNumber}`);
+      const response = await runJob(`duty-assignments/generate?week_number=${weekNumber}`);
       toast.success(response.data.message);
       setSuggestions(response.data.suggestions || []);
       await fetchAssignments();
@@ -0,0 +1,28 @@
+import axios from "axios";
+import { API } from "@/App";
+
+const POLL_INTERVAL_MS = 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Submits a background job, polls it until it finishes and returns the
+// result response. Long operations run on the server's job workers, so no
+// single request stays open long enough to hit a proxy timeout.
+export async function runJob(path, { onProgress, responseType } = {}) {
+  const { data: submitted } = await axios.post(`${API}/jobs/${path}`);
+  const jobId = submitted.job_id;
+
+  for (;;) {
+    const { data: job } = await axios.get(`${API}/jobs/${jobId}`);
+    if (onProgress) onProgress(job);
+    if (job.status === "succeeded") break;
+    if (job.status === "failed" || job.status === "cancelled") {
+      const error = new Error(job.error || `Job ${job.status}`);
+      error.job = job;
+      throw error;
+    }
+    await sleep(POLL_INTERVAL_MS);
+  }
+
+  return axios.get(`${API}/jobs/${jobId}/result`, { responseType });
+}
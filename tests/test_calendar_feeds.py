@@ -0,0 +1,218 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+
+def make_event(**overrides):
+    event = {
+        "uid": "a1",
+        "date": date(2025, 3, 4),
+        "stamp": datetime(2025, 3, 1, 9, 30, tzinfo=timezone.utc),
+        "summary": "Nöbet: 5-A",
+        "location": "5-A",
+        "week_number": 3,
+    }
+    event.update(overrides)
+    return event
+
+
+@pytest.mark.parametrize("text", ["a" * 200, "ş" * 100, "x" + "ğüşöç" * 40, "Öğretmen " * 30])
+def test_ical_fold_keeps_octet_limit_and_utf8_sequences(text):
+    line = f"SUMMARY:{text}"
+
+    folded = server.ical_fold(line)
+
+    physical = folded.split("\r\n")
+    assert all(len(part.encode()) <= 75 for part in physical)
+    assert all(part.startswith(" ") for part in physical[1:])
+    # Unfolding (drop CRLF + one space) restores the original line
+    assert folded.replace("\r\n ", "") == line
+
+
+def test_ical_fold_leaves_short_lines_alone():
+    assert server.ical_fold("SUMMARY:kısa") == "SUMMARY:kısa"
+
+
+def test_ical_escape():
+    assert server.ical_escape("a,b;c\\d\ne") == r"a\,b\;c\\d\ne"
+
+
+def test_ical_render_is_deterministic_and_uses_event_stamp():
+    events = [make_event()]
+
+    first = server.render_teacher_ical("Ayşe", events)
+    second = server.render_teacher_ical("Ayşe", events)
+
+    assert first == second
+    assert "DTSTAMP:20250301T093000Z" in first
+    assert "DTSTART;VALUE=DATE:20250304" in first
+    assert "DTEND;VALUE=DATE:20250305" in first
+    assert server.feed_etag(first) == server.feed_etag(second)
+
+
+def test_feed_stamp_sources():
+    fallback = date(2025, 3, 4)
+    aware = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+    assert server.feed_stamp(aware, fallback) == aware
+    assert server.feed_stamp(aware.isoformat(), fallback) == aware
+    assert server.feed_stamp(datetime(2025, 3, 1, 12, 0), fallback) == aware
+    assert server.feed_stamp(None, fallback) == datetime(2025, 3, 4, tzinfo=timezone.utc)
+    assert server.feed_stamp("not a date", fallback) == datetime(2025, 3, 4, tzinfo=timezone.utc)
+
+
+def test_parse_feed_date_formats():
+    assert server.parse_feed_date("2025-03-04") == date(2025, 3, 4)
+    assert server.parse_feed_date(" 04.03.2025 ") == date(2025, 3, 4)
+    assert server.parse_feed_date("04/03/2025") == date(2025, 3, 4)
+    assert server.parse_feed_date("yarın") is None
+    assert server.parse_feed_date(None) is None
+
+
+def test_render_teacher_csv():
+    body = server.render_teacher_csv([make_event()])
+
+    assert body.splitlines() == ["Tarih,Gün,Nöbet,Yer,Hafta", "2025-03-04,Salı,Nöbet: 5-A,5-A,3"]
+
+
+def request_with(if_none_match=None):
+    headers = {"if-none-match": if_none_match} if if_none_match is not None else {}
+    return SimpleNamespace(headers=headers)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", W/"abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+])
+def test_etag_matches(header, expected):
+    assert server.etag_matches(request_with(header), 'W/"abc"') is expected
+
+
+def test_make_etag_is_per_tenant():
+    assert server.make_etag("u1", "teachers", 3) != server.make_etag("u2", "teachers", 3)
+    assert server.make_etag("u1", "teachers", 3) != server.make_etag("u1", "teachers", 4)
+    assert server.make_etag("u1", "teachers", 3) == server.make_etag("u1", "teachers", 3)
+
+
+def test_feed_urls_are_absolute():
+    from starlette.requests import Request
+
+    request = Request({
+        "type": "http",
+        "app": server.app,
+        "router": server.app.router,
+        "scheme": "https",
+        "server": ("nobet.example", 443),
+        "root_path": "",
+        "path": "/api/teachers/t1/calendar-feed",
+        "headers": [(b"host", b"nobet.example")],
+    })
+
+    urls = server.feed_urls(request, "tok")
+
+    assert urls == {
+        "token": "tok",
+        "ics_url": "https://nobet.example/api/calendar/tok.ics",
+        "csv_url": "https://nobet.example/api/calendar/tok.csv",
+    }
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeArchivedWeeks:
+    def __init__(self, docs):
+        self.docs = docs
+        self.full_reads = 0
+
+    def find(self, query, projection):
+        docs = [d for d in self.docs if d["user_id"] == query["user_id"]]
+        if "week_number" in query:
+            docs = [d for d in docs if d["week_number"] in query["week_number"]["$in"]]
+            self.full_reads += len(docs)
+            return FakeCursor([dict(d) for d in docs])
+        return FakeCursor([{"week_number": d["week_number"], "compacted_at": d["compacted_at"]} for d in docs])
+
+
+def archived_week(week_number, compacted_at):
+    row = {
+        "id": f"a{week_number}", "teacher_id": "t1", "classroom_id": "c1", "day": 0,
+        "start_date": "2025-03-03", "end_date": "2025-03-07",
+        "approved_at": compacted_at, "created_at": compacted_at, "transformed_from": None,
+    }
+    return {**server.build_archived_week("u1", week_number, [row]), "compacted_at": compacted_at}
+
+
+def test_archived_feed_rows_are_decompressed_once_per_compaction(monkeypatch):
+    stamp = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    archive = FakeArchivedWeeks([archived_week(1, stamp), archived_week(2, stamp)])
+    monkeypatch.setattr(server, "db", SimpleNamespace(archived_weeks=archive))
+    monkeypatch.setattr(server, "archived_feed_rows", server.OrderedDict())
+
+    first = asyncio.run(server.load_archived_feed_rows("u1"))
+    second = asyncio.run(server.load_archived_feed_rows("u1"))
+
+    assert [r["id"] for r in first] == ["a1", "a2"]
+    assert second == first
+    assert archive.full_reads == 2
+
+    # Re-compaction (or a thaw and a new compaction) changes compacted_at
+    archive.docs[1] = archived_week(2, stamp + timedelta(days=1))
+    asyncio.run(server.load_archived_feed_rows("u1"))
+    assert archive.full_reads == 3
+
+
+def test_archived_feed_rows_cache_is_bounded(monkeypatch):
+    stamp = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    archive = FakeArchivedWeeks([archived_week(w, stamp) for w in range(1, 6)])
+    monkeypatch.setattr(server, "db", SimpleNamespace(archived_weeks=archive))
+    monkeypatch.setattr(server, "archived_feed_rows", server.OrderedDict())
+    monkeypatch.setattr(server, "FEED_ARCHIVE_CACHE_WEEKS", 3)
+
+    rows = asyncio.run(server.load_archived_feed_rows("u1"))
+
+    assert len(rows) == 5
+    assert len(server.archived_feed_rows) == 3
+
+
+def test_calendar_feed_for_teacher_deleted_meanwhile_is_404(monkeypatch):
+    async def find_teacher(query, projection):
+        return {"id": "t1"}
+
+    async def find_feed(query, projection):
+        return None
+
+    rebuilt = []
+
+    async def rebuild(user_id, teacher_id=None):
+        rebuilt.append((user_id, teacher_id))
+
+    monkeypatch.setattr(server, "db", SimpleNamespace(
+        teachers=SimpleNamespace(find_one=find_teacher),
+        teacher_feeds=SimpleNamespace(find_one=find_feed),
+    ))
+    monkeypatch.setattr(server, "rebuild_teacher_feeds", rebuild)
+
+    with pytest.raises(server.HTTPException) as excinfo:
+        asyncio.run(server.get_teacher_calendar_feed("t1", None, SimpleNamespace(id="u1")))
+
+    assert excinfo.value.status_code == 404
+    # Only the requested teacher's feed is rendered inline
+    assert rebuilt == [("u1", "t1")]
@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+NOW = datetime(2025, 3, 7, 12, 0, tzinfo=timezone.utc)
+
+
+def make_row(assignment_id, day=0, teacher_id="t1", classroom_id="c1", **overrides):
+    row = {
+        "id": assignment_id,
+        "teacher_id": teacher_id,
+        "classroom_id": classroom_id,
+        "day": day,
+        "week_number": 3,
+        "start_date": "2025-03-03",
+        "end_date": "2025-03-07",
+        "approved": True,
+        "approved_at": NOW,
+        "transformed_from": None,
+        "user_id": "u1",
+        "created_at": NOW - timedelta(days=1),
+    }
+    row.update(overrides)
+    return row
+
+
+@pytest.mark.parametrize("compression", ["zlib", ""])
+def test_encode_decode_round_trip(monkeypatch, compression):
+    monkeypatch.setattr(server, "COLD_STORAGE_COMPRESSION", compression)
+    entries = [["c1", 0, "t1", None], ["c2", 4, "t2", "old-id"]]
+
+    encoded = server.encode_archive_entries(entries)
+
+    if compression == "zlib":
+        assert encoded["compression"] == "zlib"
+        assert "entries" not in encoded
+    else:
+        assert encoded == {"compression": None, "entries": entries}
+    assert server.decode_archive_entries(encoded) == entries
+
+
+@pytest.mark.parametrize("compression", ["zlib", ""])
+def test_build_and_expand_archived_week_is_lossless(monkeypatch, compression):
+    monkeypatch.setattr(server, "COLD_STORAGE_COMPRESSION", compression)
+    rows = [
+        make_row("a1", day=0, approved_at=NOW - timedelta(hours=2, milliseconds=5), created_at=NOW - timedelta(days=3)),
+        make_row("a2", day=3, teacher_id="t2", classroom_id="c2", transformed_from="src"),
+    ]
+
+    archived = server.build_archived_week("u1", 3, rows)
+
+    assert archived["count"] == 2
+    assert archived["assignment_ids"] == ["a1", "a2"]
+    # Per-row timestamps survive, not just the week-level max/min
+    assert server.expand_archived_week(archived) == rows
+
+
+def test_expand_legacy_entries_fall_back_to_week_timestamps(monkeypatch):
+    monkeypatch.setattr(server, "COLD_STORAGE_COMPRESSION", "")
+    archived = server.build_archived_week("u1", 3, [make_row("a1")])
+    archived["entries"] = [entry[:4] for entry in archived["entries"]]
+    archived["approved_at"] = NOW + timedelta(hours=1)
+
+    expanded = server.expand_archived_week(archived)
+
+    assert expanded[0]["approved_at"] == NOW + timedelta(hours=1)
+    assert expanded[0]["created_at"] == archived["created_at"]
+
+
+def test_build_archived_week_uses_latest_approval_and_earliest_creation():
+    rows = [
+        make_row("a1", approved_at=NOW - timedelta(hours=1), created_at=NOW - timedelta(days=2)),
+        make_row("a2", approved_at=NOW, created_at=NOW - timedelta(days=1)),
+    ]
+
+    archived = server.build_archived_week("u1", 3, rows)
+
+    assert archived["approved_at"] == NOW
+    assert archived["created_at"] == NOW - timedelta(days=2)
+
+
+def test_merge_tiers_prefers_hot_rows():
+    hot = [make_row("a1", teacher_id="edited")]
+    cold = [make_row("a1"), make_row("a2")]
+
+    merged = server.merge_tiers(hot, cold)
+
+    assert [r["id"] for r in merged] == ["a1", "a2"]
+    assert merged[0]["teacher_id"] == "edited"
+
+
+def test_has_uniform_dates():
+    assert server.has_uniform_dates([make_row("a1"), make_row("a2")])
+    assert server.has_uniform_dates([])
+    assert not server.has_uniform_dates([make_row("a1"), make_row("a2", end_date="2025-03-08")])
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the thaw path: equality
+    queries, with list fields matching any of their elements."""
+
+    def __init__(self, docs=()):
+        self.docs = [dict(d) for d in docs]
+
+    def _matches(self, doc, query):
+        return all(
+            value in doc.get(field) if isinstance(doc.get(field), list) else doc.get(field) == value
+            for field, value in query.items()
+        )
+
+    async def find_one(self, query, projection=None):
+        return next((dict(d) for d in self.docs if self._matches(d, query)), None)
+
+    async def distinct(self, field, query):
+        return [d[field] for d in self.docs if self._matches(d, query)]
+
+    async def insert_many(self, docs):
+        self.docs.extend(dict(d) for d in docs)
+
+    async def delete_one(self, query):
+        match = next((d for d in self.docs if self._matches(d, query)), None)
+        if match is not None:
+            self.docs.remove(match)
+        return SimpleNamespace(deleted_count=int(match is not None))
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    from tests.test_week_leases import FakeLeaseCollection
+
+    archived = server.build_archived_week("u1", 3, [make_row("a1"), make_row("a2", day=1)])
+    fake_db = SimpleNamespace(
+        duty_assignments=FakeCollection([make_row("d1", week_number=4, approved=False)]),
+        archived_weeks=FakeCollection([archived]),
+        week_leases=FakeLeaseCollection(),
+    )
+    monkeypatch.setattr(server, "db", fake_db)
+    return fake_db
+
+
+def test_write_assignment_thaws_archived_week_under_lease(tiers):
+    seen = []
+
+    async def write(query):
+        # The lease is held and the whole week is hot when the write runs
+        assert "u1:3" in tiers.week_leases.docs
+        seen.append(query)
+        return (await tiers.duty_assignments.delete_one(query)).deleted_count > 0
+
+    assert asyncio.run(server.write_assignment("u1", "a1", write))
+
+    assert seen == [{"id": "a1", "user_id": "u1", "week_number": 3}]
+    assert tiers.archived_weeks.docs == []
+    assert [d["id"] for d in tiers.duty_assignments.docs] == ["d1", "a2"]
+    # Thawed rows are marked so compaction leaves the week alone for a horizon
+    assert tiers.duty_assignments.docs[1]["thawed_at"] is not None
+    assert tiers.week_leases.docs == {}
+
+
+def test_write_assignment_skips_lease_for_drafts(tiers, monkeypatch):
+    def no_lease(*args):
+        raise AssertionError("drafts should not take the week lease")
+
+    monkeypatch.setattr(server, "week_lease", no_lease)
+
+    async def write(query):
+        return query == {"id": "d1", "user_id": "u1", "week_number": 4, "approved": False}
+
+    assert asyncio.run(server.write_assignment("u1", "d1", write))
+
+
+def test_write_assignment_unknown_id(tiers):
+    async def write(query):
+        raise AssertionError("nothing to write")
+
+    assert not asyncio.run(server.write_assignment("u1", "missing", write))
@@ -0,0 +1,244 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from starlette.requests import Request
+
+import server
+
+USER = SimpleNamespace(id="u1")
+
+
+class FakeVersions:
+    def __init__(self, versions=None):
+        self.versions = dict(versions or {})
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        key = (query["user_id"], query["collection"])
+        return {"version": self.versions[key]} if key in self.versions else None
+
+    async def find(self, query, projection=None):
+        for (user_id, collection), version in self.versions.items():
+            yield {"user_id": user_id, "collection": collection, "version": version}
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        key = (query["user_id"], query["collection"])
+        self.versions[key] = self.versions.get(key, 0) + update["$inc"]["version"]
+        return {"version": self.versions[key]}
+
+
+class FakeSchools:
+    def __init__(self):
+        self.reads = 0
+
+    def find(self, query, projection=None):
+        self.reads += 1
+
+        async def to_list(length):
+            return [{"id": "s1", "name": "Merkez", "building": "A", "user_id": "u1"}]
+
+        return SimpleNamespace(to_list=to_list)
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    collection = FakeVersions({("u1", "schools"): 4})
+    monkeypatch.setattr(server, "db", SimpleNamespace(collection_versions=collection, schools=FakeSchools()))
+    monkeypatch.setattr(server, "version_cache", {})
+    monkeypatch.setattr(server, "version_cache_live", False)
+    monkeypatch.setattr(server, "FEED_SOURCE_COLLECTIONS", set())
+    return collection
+
+
+def request_with(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/api/schools", "headers": headers})
+
+
+def test_version_is_cached_until_it_expires(versions, monkeypatch):
+    async def scenario():
+        assert await server.get_collection_version("u1", "schools") == 4
+        assert await server.get_collection_version("u1", "schools") == 4
+        assert versions.reads == 1
+
+        monkeypatch.setattr(server, "VERSION_CACHE_SECONDS", 0)
+        versions.versions[("u1", "schools")] = 5  # bumped by another worker
+        assert await server.get_collection_version("u1", "schools") == 5
+        assert versions.reads == 2
+
+    asyncio.run(scenario())
+
+
+def test_live_cache_does_not_expire(versions, monkeypatch):
+    monkeypatch.setattr(server, "VERSION_CACHE_SECONDS", 0)
+    monkeypatch.setattr(server, "version_cache_live", True)
+    server.cache_collection_version("u1", "schools", 4)
+
+    assert asyncio.run(server.get_collection_version("u1", "schools")) == 4
+    assert versions.reads == 0
+
+
+def test_bump_updates_cache(versions):
+    async def scenario():
+        await server.get_collection_version("u1", "schools")
+        await server.bump_collection_version("u1", "schools")
+        assert await server.get_collection_version("u1", "schools") == 5
+        assert versions.reads == 1
+
+    asyncio.run(scenario())
+
+
+def test_cached_version_never_goes_backwards(versions):
+    server.cache_collection_version("u1", "schools", 7)
+    server.cache_collection_version("u1", "schools", 6)  # late, older value
+
+    assert server.version_cache[("u1", "schools")][0] == 7
+
+
+def test_matching_etag_gets_304_without_touching_mongo(versions):
+    server.cache_collection_version("u1", "schools", 4)
+    etag = server.make_etag("u1", "schools", 4)
+
+    response = asyncio.run(server.get_schools(request_with(etag), USER))
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert versions.reads == 0
+    assert server.db.schools.reads == 0
+
+
+def test_stale_etag_gets_full_body(versions):
+    stale = server.make_etag("u1", "schools", 3)
+
+    response = asyncio.run(server.get_schools(request_with(stale), USER))
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == server.make_etag("u1", "schools", 4)
+    assert server.json.loads(response.body)[0]["id"] == "s1"
+
+
+def test_week_etag_depends_on_week_and_filter():
+    tags = {
+        server.make_etag("u1", "duty_assignments", 1, week, approved)
+        for week in (1, 2) for approved in (None, True, False)
+    }
+    assert len(tags) == 6
+
+
+class AnyCollection:
+    """Accepts every write as successful."""
+
+    async def find_one(self, *args, **kwargs):
+        return None
+
+    async def insert_one(self, doc):
+        pass
+
+    async def _write(self, *args, **kwargs):
+        return SimpleNamespace(matched_count=1, modified_count=1, deleted_count=1)
+
+    update_one = update_many = delete_one = _write
+
+
+SCHOOL = server.SchoolCreate(name="Merkez", building="A")
+CLASSROOM = server.ClassroomCreate(school_id="s1", name="5-A", floor=1)
+TEACHER = server.TeacherCreate(name="Ayşe", school_ids=["s1"], weekly_duty_limit=3)
+SCHEDULE = server.TeacherScheduleCreate(teacher_id="t1", weekly_hours=[1, 2, 3, 4, 5])
+ASSIGNMENT = server.DutyAssignmentCreate(teacher_id="t1", classroom_id="c1", day=0, week_number=3)
+SCHOOL_DUTY = server.SchoolDutyCreate(teacher_id="t1", month=3, year=2025, duty_type="yard", dates=["2025-03-04"])
+
+
+@pytest.mark.parametrize("endpoint, args, collection", [
+    ("create_school", (SCHOOL,), "schools"),
+    ("update_school", ("s1", SCHOOL), "schools"),
+    ("delete_school", ("s1",), "schools"),
+    ("create_classroom", (CLASSROOM,), "classrooms"),
+    ("update_classroom", ("c1", CLASSROOM), "classrooms"),
+    ("delete_classroom", ("c1",), "classrooms"),
+    ("create_teacher", (TEACHER,), "teachers"),
+    ("update_teacher", ("t1", TEACHER), "teachers"),
+    ("delete_teacher", ("t1",), "teachers"),
+    ("create_teacher_schedule", (SCHEDULE,), "teacher_schedules"),
+    ("create_duty_assignment", (ASSIGNMENT,), "duty_assignments"),
+    ("update_duty_assignment", ("a1", ASSIGNMENT), "duty_assignments"),
+    ("delete_duty_assignment", ("a1",), "duty_assignments"),
+    ("approve_duty_assignments", (3,), "duty_assignments"),
+    ("update_archived_assignment", (3, "a1", ASSIGNMENT), "duty_assignments"),
+    ("create_school_duty", (SCHOOL_DUTY,), "school_duties"),
+    ("delete_school_duty", ("d1",), "school_duties"),
+])
+def test_writes_bump_their_collection(monkeypatch, endpoint, args, collection):
+    bumped = []
+
+    async def bump(user_id, name):
+        bumped.append((user_id, name))
+
+    @asynccontextmanager
+    async def no_lease(user_id, week_number):
+        yield
+
+    async def write_assignment(user_id, assignment_id, write):
+        return await write({"id": assignment_id, "user_id": user_id, "week_number": 3})
+
+    any_collection = AnyCollection()
+    monkeypatch.setattr(server, "db", SimpleNamespace(**{
+        name: any_collection for name in
+        ("schools", "classrooms", "teachers", "teacher_schedules", "duty_assignments", "school_duties")
+    }))
+    monkeypatch.setattr(server, "bump_collection_version", bump)
+    monkeypatch.setattr(server, "week_lease", no_lease)
+    monkeypatch.setattr(server, "write_assignment", write_assignment)
+
+    asyncio.run(getattr(server, endpoint)(*args, current_user=USER))
+
+    assert bumped == [("u1", collection)]
+
+
+class FakeStream:
+    def __init__(self, supported, changes=()):
+        self.supported = supported
+        self.changes = list(changes)
+        self.closed = False
+
+    async def try_next(self):
+        if not self.supported:
+            raise server.OperationFailure("The $changeStream stage is only supported on replica sets")
+        return None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.changes:
+            return self.changes.pop(0)
+        await asyncio.sleep(3600)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.parametrize("supported", [True, False])
+def test_start_version_cache(versions, monkeypatch, supported):
+    change = {"fullDocument": {"user_id": "u2", "collection": "teachers", "version": 9}}
+    stream = FakeStream(supported, [change])
+    versions.watch = lambda **kwargs: stream
+
+    async def scenario():
+        await server.start_version_cache()
+        await asyncio.sleep(0)
+        assert server.version_cache_live is supported
+        # Prefilled at startup, so the first conditional GET needs no read
+        assert await server.get_collection_version("u1", "schools") == 4
+        assert versions.reads == 0
+        if supported:
+            # Bumps made through other workers arrive through the stream
+            assert server.version_cache[("u2", "teachers")][0] == 9
+        else:
+            assert stream.closed
+        await server.stop_version_cache()
+        assert server.version_cache_live is False
+
+    asyncio.run(scenario())
@@ -0,0 +1,30 @@
+import asyncio
+
+import server
+
+
+def test_job_worker_survives_execute_failures(monkeypatch):
+    jobs = [{"id": "j1", "kind": "generate"}, {"id": "j2", "kind": "generate"}]
+    executed = []
+
+    async def claim_next_job():
+        return jobs.pop(0) if jobs else None
+
+    async def execute_job(job):
+        executed.append(job["id"])
+        raise RuntimeError("transient Mongo error in finish_job")
+
+    monkeypatch.setattr(server, "claim_next_job", claim_next_job)
+    monkeypatch.setattr(server, "execute_job", execute_job)
+    monkeypatch.setattr(server, "JOB_POLL_INTERVAL", 0.01)
+
+    async def scenario():
+        monkeypatch.setattr(server, "job_wakeup", asyncio.Event())
+        worker = asyncio.create_task(server.job_worker())
+        await asyncio.sleep(0.1)
+        # Both jobs were attempted and the worker is still polling
+        assert executed == ["j1", "j2"]
+        assert not worker.done()
+        worker.cancel()
+
+    asyncio.run(scenario())
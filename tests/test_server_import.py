@@ -0,0 +1,6 @@
+def test_server_imports_without_database():
+    # Mongo is only contacted in the lifespan handler, so importing must not fail
+    import server
+
+    assert server.app is not None
+    assert server.db is None
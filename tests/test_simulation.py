@@ -0,0 +1,136 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+import server
+
+TEACHERS = [
+    {"id": "t1", "name": "Ayşe", "school_ids": ["s1"], "weekly_duty_limit": 5},
+    {"id": "t2", "name": "Mehmet", "school_ids": ["s1"], "weekly_duty_limit": 5},
+]
+SCHEDULES = [
+    {"teacher_id": "t1", "weekly_hours": [8, 8, 8, 8, 8]},
+    {"teacher_id": "t2", "weekly_hours": [2, 2, 2, 2, 2]},
+]
+CLASSROOMS = [{"id": "c1", "school_id": "s1", "name": "5-A", "floor": 1}]
+
+
+def simulate(**variant):
+    return server.simulate_variant(TEACHERS, SCHEDULES, CLASSROOMS, variant, 1, "u1")
+
+
+def test_baseline_coverage_and_fairness():
+    result = simulate(name="baseline")
+
+    assert result["assigned"] == 5
+    assert result["slots"] == 5
+    assert result["coverage"] == 1.0
+    # Duties alternate, lighter-loaded t2 first: t2 gets 3, t1 gets 2
+    assert result["fairness"]["min_duties"] == 2
+    assert result["fairness"]["max_duties"] == 3
+    assert result["fairness"]["jain_index"] == round(25 / (2 * 13), 4)
+    # Every duty t1 gets lands on an 8-hour day
+    assert result["heavy_day_suggestions"] == 2
+
+
+def test_lower_limits_reduce_coverage():
+    result = simulate(weekly_duty_limits={"t1": 1}, duty_limit_delta=-1)
+
+    # t1: 1 - 1 = 0, t2: 5 - 1 = 4
+    assert result["assigned"] == 4
+    assert result["coverage"] == 0.8
+    assert result["fairness"]["min_duties"] == 0
+    assert result["fairness"]["jain_index"] == 0.5
+
+
+def test_extra_classrooms_add_slots():
+    result = simulate(extra_classrooms=[{"school_id": "s1", "name": "Bahçe", "floor": 0}])
+
+    assert result["slots"] == 10
+    assert result["assigned"] == 10
+    # 5 duties each: perfectly even
+    assert result["fairness"]["jain_index"] == 1.0
+
+
+def test_exclude_heavy_days_keeps_teachers_off_them():
+    result = simulate(exclude_heavy_days=True)
+
+    assert result["assigned"] == 5
+    assert result["heavy_day_suggestions"] == 0
+    assert result["fairness"]["min_duties"] == 0
+    assert result["fairness"]["max_duties"] == 5
+
+
+def test_excluded_days():
+    result = simulate(excluded_days={"t2": [0, 1, 2, 3, 4]})
+
+    assert result["fairness"]["max_duties"] == 5
+    assert result["heavy_day_suggestions"] == 5
+
+
+def test_simulation_without_teachers_is_empty():
+    result = server.simulate_variant([], [], CLASSROOMS, {}, 1, "u1")
+
+    assert result["assigned"] == 0
+    assert result["coverage"] == 0
+    assert result["fairness"]["jain_index"] == 1.0
+
+
+def test_excluded_days_must_be_weekdays():
+    with pytest.raises(ValidationError):
+        server.SimulationVariant(excluded_days={"t1": [5]})
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return list(self.docs)
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor(self.docs)
+
+
+@pytest.fixture
+def snapshot(monkeypatch):
+    monkeypatch.setattr(server, "db", SimpleNamespace(
+        teachers=FakeCollection(TEACHERS),
+        teacher_schedules=FakeCollection(SCHEDULES),
+        classrooms=FakeCollection(CLASSROOMS),
+    ))
+
+
+@pytest.mark.parametrize("variant", [
+    {"weekly_duty_limits": {"t9": 3}},
+    {"excluded_days": {"t9": [1]}},
+])
+def test_simulate_endpoint_rejects_unknown_teachers(snapshot, variant):
+    simulation = server.SimulationRequest(week_number=1, variants=[variant])
+    user = SimpleNamespace(id="u1")
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(server.simulate_duty_assignments(simulation, user))
+
+    assert excinfo.value.status_code == 422
+    assert "t9" in excinfo.value.detail
+
+
+def test_simulate_endpoint_scores_baseline_and_variants(snapshot):
+    simulation = server.SimulationRequest(week_number=1, variants=[{"name": "rahat", "exclude_heavy_days": True}])
+    user = SimpleNamespace(id="u1")
+
+    response = asyncio.run(server.simulate_duty_assignments(simulation, user))
+
+    body = server.json.loads(response.body)
+    assert body["baseline"]["heavy_day_suggestions"] == 2
+    assert [v["name"] for v in body["variants"]] == ["rahat"]
+    assert body["variants"][0]["heavy_day_suggestions"] == 0
@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+import server
+
+
+class FakeLeaseCollection:
+    """In-memory stand-in for week_leases with Mongo's upsert-on-_id semantics."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def _matches(self, doc, query):
+        for field, condition in query.items():
+            if field == "_id":
+                continue
+            if isinstance(condition, dict):
+                if not doc.get(field) < condition["$lt"]:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if doc is not None and self._matches(doc, query):
+            doc.update(update["$set"])
+            return SimpleNamespace(matched_count=1)
+        if not upsert:
+            return SimpleNamespace(matched_count=0)
+        if doc is not None:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.docs[query["_id"]] = {"_id": query["_id"], **update["$set"]}
+        return SimpleNamespace(matched_count=0)
+
+    async def delete_one(self, query):
+        doc = self.docs.get(query["_id"])
+        if doc is not None and self._matches(doc, query):
+            del self.docs[query["_id"]]
+
+
+@pytest.fixture
+def leases(monkeypatch):
+    collection = FakeLeaseCollection()
+    monkeypatch.setattr(server, "db", SimpleNamespace(week_leases=collection))
+    return collection
+
+
+def test_lease_is_exclusive_until_expiry(leases):
+    async def scenario():
+        assert await server.try_acquire_week_lease("u1:3", "u1", 3, "holder-a")
+        assert not await server.try_acquire_week_lease("u1:3", "u1", 3, "holder-b")
+        # Other weeks and tenants are unaffected
+        assert await server.try_acquire_week_lease("u1:4", "u1", 4, "holder-b")
+        assert await server.try_acquire_week_lease("u2:3", "u2", 3, "holder-b")
+
+        leases.docs["u1:3"]["expires_at"] -= server.timedelta(seconds=server.WEEK_LEASE_SECONDS + 1)
+        assert await server.try_acquire_week_lease("u1:3", "u1", 3, "holder-b")
+        assert leases.docs["u1:3"]["holder"] == "holder-b"
+
+    asyncio.run(scenario())
+
+
+def test_week_lease_releases_on_exit(leases):
+    async def scenario():
+        async with server.week_lease("u1", 3):
+            assert "u1:3" in leases.docs
+        assert "u1:3" not in leases.docs
+
+    asyncio.run(scenario())
+
+
+def test_week_lease_times_out_while_held(leases, monkeypatch):
+    monkeypatch.setattr(server, "WEEK_LEASE_WAIT_SECONDS", 0.2)
+
+    async def scenario():
+        await server.try_acquire_week_lease("u1:3", "u1", 3, "someone-else")
+        with pytest.raises(HTTPException) as excinfo:
+            async with server.week_lease("u1", 3):
+                pass
+        assert excinfo.value.status_code == 409
+
+    asyncio.run(scenario())
+
+
+def test_week_lease_aborts_holder_when_lease_is_lost(leases, monkeypatch):
+    monkeypatch.setattr(server, "WEEK_LEASE_SECONDS", 0.3)
+
+    async def scenario():
+        with pytest.raises(HTTPException) as excinfo:
+            async with server.week_lease("u1", 3):
+                # Another worker takes the lease over; the next renewal must notice
+                leases.docs["u1:3"]["holder"] = "someone-else"
+                await asyncio.sleep(1)
+        assert excinfo.value.status_code == 409
+        # The new owner's lease is left alone
+        assert leases.docs["u1:3"]["holder"] == "someone-else"
+
+    asyncio.run(scenario())
+
+
+class FakeWeekCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.deleted = []
+
+    def _matches(self, doc, query):
+        return all(doc.get(field) == value for field, value in query.items())
+
+    def find(self, query, projection=None):
+        docs = [d for d in self.docs if self._matches(d, query)]
+        return SimpleNamespace(to_list=lambda length: asyncio.sleep(0, docs))
+
+    async def find_one(self, query, projection=None):
+        return next((d for d in self.docs if self._matches(d, query)), None)
+
+    async def delete_many(self, query):
+        self.deleted.append(query)
+
+
+@pytest.mark.parametrize("approved_rows, archived", [
+    ([{"user_id": "u1", "week_number": 3, "approved": True}], []),
+    ([], [{"user_id": "u1", "week_number": 3}]),
+])
+def test_generate_refuses_approved_week(monkeypatch, approved_rows, archived):
+    assignments = FakeWeekCollection(approved_rows)
+    monkeypatch.setattr(server, "db", SimpleNamespace(
+        week_leases=FakeLeaseCollection(),
+        teachers=FakeWeekCollection(),
+        teacher_schedules=FakeWeekCollection(),
+        classrooms=FakeWeekCollection(),
+        duty_assignments=assignments,
+        archived_weeks=FakeWeekCollection(archived),
+    ))
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(server.run_generate("u1", 3))
+
+    assert excinfo.value.status_code == 409
+    # Nothing was cleared
+    assert assignments.deleted == []